@@ -0,0 +1,137 @@
+from bisect import bisect_left
+import gzip
+from hashlib import md5
+from threading import Lock
+from urllib.parse import urlencode
+
+from rest_framework.renderers import JSONRenderer
+
+from recipes.versions import get_cache, get_version
+
+
+def get_request_url(request):
+    """Адрес запроса с нормализованной строкой параметров."""
+    query = urlencode(sorted(
+        (key, sorted(values))
+        for key, values in request.query_params.lists()
+    ), doseq=True)
+    return f'{request.get_host()}{request.path}?{query}'
+
+
+def get_response_key(prefix, request):
+    """Ключ ответа по версии раздела и адресу запроса."""
+    return (f'api:{prefix}:{get_version(prefix)}:'
+            f'{md5(get_request_url(request).encode()).hexdigest()}')
+
+
+def get_validators(prefixes, request, per_user=False, encoding=''):
+    """ETag и Last-Modified ответа по версиям разделов.
+    Для ответов, зависящих от пользователя, учитывается версия
+    его избранного, корзины и подписок, для сжатых ответов -
+    Content-Encoding."""
+    user = request.user
+    if per_user and user.is_authenticated:
+        prefixes = (*prefixes, f'user{user.id}')
+    versions = [get_version(prefix) for prefix in prefixes]
+    fingerprint = (f'{versions}:{user.id if per_user else None}:'
+                   f'{request.accepted_renderer.format}:{encoding}:'
+                   f'{get_request_url(request)}')
+    return (f'"{md5(fingerprint.encode()).hexdigest()}"',
+            max(versions) // 10 ** 9)
+
+
+def count_event(prefix, event):
+    """Счётчики попаданий и промахов кэша, общие для всех воркеров."""
+    key = f'api:{prefix}:{event}'
+    cache = get_cache()
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def get_stats(prefix):
+    cache = get_cache()
+    return {event: cache.get(f'api:{prefix}:{event}', 0)
+            for event in ('hits', 'misses',)}
+
+
+def reset_stats(prefix):
+    get_cache().delete_many(
+        [f'api:{prefix}:{event}' for event in ('hits', 'misses',)])
+
+
+def normalize(text):
+    """Приведение строки к виду для поиска без учёта регистра и ё."""
+    return text.casefold().replace('ё', 'е')
+
+
+class VersionedSnapshot:
+    """Данные, хранящиеся в памяти воркера и перестраиваемые
+    только при смене версии раздела."""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.version = None
+        self.value = None
+        self.lock = Lock()
+
+    def build(self, data):
+        raise NotImplementedError
+
+    def get(self, get_data):
+        version = get_version(self.prefix)
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    self.value = self.build(get_data())
+                    self.version = version
+        return self.value
+
+
+class JSONSnapshot(VersionedSnapshot):
+    """Заранее отрисованный JSON и его gzip-вариант."""
+
+    def build(self, data):
+        content = JSONRenderer().render(data)
+        return content, gzip.compress(content)
+
+
+class MappingSnapshot(VersionedSnapshot):
+    """Словарь из пар ключ-значение, например слаг тега - id."""
+
+    def build(self, pairs):
+        return dict(pairs)
+
+
+class PrefixIndex(VersionedSnapshot):
+    """Отсортированный индекс названий для автодополнения: сначала
+    совпадения по началу названия (бинарный поиск), затем вхождения."""
+
+    def __init__(self, prefix, field='name'):
+        super().__init__(prefix)
+        self.field = field
+
+    def build(self, rows):
+        rows = sorted(
+            ((normalize(row[self.field]), row) for row in rows),
+            key=lambda item: item[0],
+        )
+        return [key for key, _ in rows], [row for _, row in rows]
+
+    def search(self, get_rows, query, limit):
+        keys, rows = self.get(get_rows)
+        query = normalize(query)
+        found = []
+        for index in range(bisect_left(keys, query), len(keys)):
+            if len(found) >= limit or not keys[index].startswith(query):
+                break
+            found.append(index)
+        if query and len(found) < limit:
+            for index, key in enumerate(keys):
+                if query in key and not key.startswith(query):
+                    found.append(index)
+                    if len(found) >= limit:
+                        break
+        return [rows[index] for index in found]
@@ -1,23 +1,42 @@
+import re
+
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import BooleanField, Exists, FloatField, OuterRef, Q
+from django.db.models.expressions import RawSQL
 from django_filters import rest_framework as filters, NumberFilter
 
-from recipes.models import Recipe
+from recipes.models import Recipe, Tag
+from .cache import MappingSnapshot
 
 
 User = get_user_model()
 
+TAG_IDS = MappingSnapshot('reference')
+
 
 class RecipeFilter(filters.FilterSet):
     """Фильтр для рецептов"""
 
-    tags = filters.AllValuesMultipleFilter(
-        field_name='tags__slug', lookup_expr='contains',)
+    tags = filters.CharFilter(method='filter_tags')
     is_in_shopping_cart = NumberFilter(method='filter_is_in_shopping_cart')
     is_favorited = NumberFilter(method='filter_is_favorited')
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+                  'search')
+
+    def filter_tags(self, queryset, name, value):
+        slug_ids = TAG_IDS.get(lambda: Tag.objects.values_list('slug', 'id'))
+        tag_ids = {slug_ids[slug] for slug in self.data.getlist(name)
+                   if slug in slug_ids}
+        if not tag_ids:
+            return queryset.none()
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'), tag_id__in=tag_ids,
+        )))
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         return queryset.filter(purchases__user_id=self.request.user.id)
@@ -25,8 +44,36 @@ class RecipeFilter(filters.FilterSet):
     def filter_is_favorited(self, queryset, name, value):
         return queryset.filter(favorites__user_id=self.request.user.id)
 
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
 
-class IngredientFilter(filters.FilterSet):
-    """Фильтр для ингредиентов"""
 
-    name = filters.CharFilter(field_name='name', lookup_expr='istartswith',)
+def search_recipes(queryset, query):
+    """Полнотекстовый поиск по названию и тексту рецепта с ранжированием
+    (индексы создаются миграцией recipes.0003_recipe_search, триггеры
+    SQLite проверяются после каждой миграции, см. recipes.search)."""
+    if connection.vendor == 'postgresql':
+        tsquery = "websearch_to_tsquery('russian', %s)"
+        return queryset.filter(RawSQL(
+            f'"recipes_recipe"."search_vector" @@ {tsquery}', (query,),
+            output_field=BooleanField(),
+        )).annotate(rank=RawSQL(
+            f'ts_rank("recipes_recipe"."search_vector", {tsquery})',
+            (query,), output_field=FloatField(),
+        )).order_by('-rank', *Recipe._meta.ordering)
+    if connection.vendor == 'sqlite':
+        words = re.findall(r'\w+', query)
+        if not words:
+            return queryset.none()
+        match = ' '.join(f'"{word}"*' for word in words)
+        # Соединение с таблицей FTS5: поиск и bm25 вычисляются за один
+        # проход по индексу, а не подзапросом для каждой строки.
+        return queryset.extra(
+            select={'rank': '-bm25(recipes_recipe_fts)'},
+            tables=('recipes_recipe_fts',),
+            where=('recipes_recipe_fts MATCH %s',
+                   'recipes_recipe_fts.rowid = recipes_recipe.id'),
+            params=(match,),
+        ).order_by('-rank', *Recipe._meta.ordering)
+    return queryset.filter(Q(name__icontains=query)
+                           | Q(text__icontains=query))
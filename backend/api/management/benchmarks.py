@@ -0,0 +1,9 @@
+from statistics import quantiles
+
+
+def percentiles(timings):
+    """p50, p95 и p99 в миллисекундах (команды benchapi и loadapi)."""
+    if len(timings) == 1:
+        return (timings[0] * 1000,) * 3
+    points = quantiles(timings, n=100, method='inclusive')
+    return tuple(points[i] * 1000 for i in (49, 94, 98))
@@ -0,0 +1,171 @@
+import json
+from time import perf_counter
+import tracemalloc
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.management.benchmarks import percentiles
+from recipes.models import Ingredient, Recipe, Tag, User
+from recipes.versions import get_cache
+
+# Метрики, сравниваемые с базовыми значениями. p99 при небольшом числе
+# повторов определяется единичными выбросами и только выводится.
+METRICS = ('p50', 'p95', 'queries', 'memory')
+
+
+class Command(BaseCommand):
+    """Класс команды замера времени ответа эндпоинтов API"""
+
+    help = ('Замер задержек (p50/p95/p99), количества SQL-запросов и пика '
+            'памяти эндпоинтов API тестовым клиентом, без сети')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кэш API перед каждым запросом',
+        )
+        parser.add_argument(
+            '--only', nargs='*', default=None,
+            help='Имена замеряемых эндпоинтов',
+        )
+        parser.add_argument(
+            '--save-baseline', default=None,
+            help='Записать результаты в json-файл базовых значений',
+        )
+        parser.add_argument(
+            '--baseline', default=None,
+            help='Сравнить результаты с json-файлом базовых значений',
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.3,
+            help='Допустимый рост задержки и памяти относительно базовых '
+                 'значений (доля), количество запросов расти не должно',
+        )
+
+    def handle(self, *args, **options):
+        if 'testserver' not in settings.ALLOWED_HOSTS:
+            settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+        if settings.DEBUG:
+            self.stderr.write('Включён DEBUG: журналирование SQL-запросов '
+                              'увеличивает задержки.')
+        endpoints = self.get_endpoints()
+        if options['only']:
+            endpoints = [endpoint for endpoint in endpoints
+                         if endpoint[0] in options['only']]
+        results = {}
+        for name, user, url in endpoints:
+            results[name] = self.measure(user, url, options)
+            self.stdout.write(
+                f'{name:<28} p50 {results[name]["p50"]:8.2f} мс  '
+                f'p95 {results[name]["p95"]:8.2f} мс  '
+                f'p99 {results[name]["p99"]:8.2f} мс  '
+                f'SQL {results[name]["queries"]:3}  '
+                f'память {results[name]["memory"] / 1024:8.0f} КБ')
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w', encoding='U8') as ofl:
+                json.dump(results, ofl, indent=2, ensure_ascii=False)
+        if options['baseline']:
+            self.compare(results, options)
+
+    def get_endpoints(self):
+        """Эндпоинты и параметры запросов, подобранные по данным БД:
+        пользователь с наибольшими корзиной и подписками, популярный
+        рецепт и теги, начало названия частого продукта."""
+        user = User.objects.annotate(
+            purchases_total=Count('purchases', distinct=True),
+            subscriptions_total=Count('subscriptions_added', distinct=True),
+        ).order_by('-purchases_total', '-subscriptions_total', 'pk').first()
+        recipe = Recipe.objects.annotate(
+            favorites_total=Count('favorites'),
+        ).order_by('-favorites_total', 'pk').first()
+        tags = Tag.objects.annotate(
+            recipes_total=Count('recipes'),
+        ).order_by('-recipes_total', 'pk').values_list('slug', flat=True)[:2]
+        ingredient = Ingredient.objects.annotate(
+            recipes_total=Count('recipeingredients'),
+        ).order_by('-recipes_total', 'pk').first()
+        if None in (user, recipe, ingredient) or not tags:
+            raise CommandError(
+                'В БД нет данных для замеров, выполните seed_foodgram.')
+        tags_query = '&'.join(f'tags={slug}' for slug in tags)
+        return [
+            ('recipes_anonymous', None, '/api/recipes/'),
+            ('recipes_authenticated', user, '/api/recipes/'),
+            ('recipes_tags', user, f'/api/recipes/?{tags_query}'),
+            ('recipes_favorited', user, '/api/recipes/?is_favorited=1'),
+            ('recipes_in_cart', user,
+             '/api/recipes/?is_in_shopping_cart=1'),
+            ('recipe_detail', user, f'/api/recipes/{recipe.pk}/'),
+            ('subscriptions', user,
+             '/api/users/subscriptions/?recipes_limit=3'),
+            ('ingredients_search', None,
+             f'/api/ingredients/?name={ingredient.name[:3]}'),
+            ('shopping_cart_txt', user,
+             '/api/recipes/download_shopping_cart/'),
+            ('shopping_cart_csv', user,
+             '/api/recipes/download_shopping_cart/?format=csv'),
+        ]
+
+    def request(self, client, url, options):
+        if options['cold']:
+            get_cache().clear()
+        response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f'{url}: код ответа {response.status_code}')
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def measure(self, user, url, options):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        for _ in range(options['warmup']):
+            self.request(client, url, options)
+        timings = []
+        for _ in range(options['iterations']):
+            started = perf_counter()
+            self.request(client, url, options)
+            timings.append(perf_counter() - started)
+        with CaptureQueriesContext(connection) as queries:
+            self.request(client, url, options)
+        # Журнал запросов очищается в начале следующего запроса.
+        query_count = len(queries)
+        tracemalloc.start()
+        try:
+            self.request(client, url, options)
+            memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        p50, p95, p99 = percentiles(timings)
+        return {'url': url, 'p50': p50, 'p95': p95, 'p99': p99,
+                'queries': query_count, 'memory': memory}
+
+    def compare(self, results, options):
+        """Ошибка команды при ухудшении метрик относительно базовых."""
+        with open(options['baseline'], encoding='U8') as ofl:
+            baseline = json.load(ofl)
+        regressions = []
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            for metric in METRICS:
+                limit = baseline[name][metric]
+                if metric != 'queries':
+                    limit *= 1 + options['tolerance']
+                if result[metric] > limit:
+                    regressions.append(
+                        f'{name}: {metric} {result[metric]:.2f} > '
+                        f'{limit:.2f}')
+        if regressions:
+            raise CommandError(
+                'Ухудшение относительно базовых значений:\n'
+                + '\n'.join(regressions))
+        self.stdout.write('Результаты в пределах базовых значений.')
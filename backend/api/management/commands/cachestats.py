@@ -0,0 +1,32 @@
+from django.core.cache.backends.dummy import DummyCache
+from django.core.management import BaseCommand, CommandError
+
+from api.cache import get_stats, reset_stats
+from recipes.versions import get_cache, is_process_local_cache
+
+
+class Command(BaseCommand):
+    """Класс команды вывода статистики кэша ответов API"""
+
+    help = 'Статистика попаданий и промахов кэша ответов API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='recipes',
+                            help='Раздел кэша (по умолчанию recipes)')
+        parser.add_argument('--reset', action='store_true',
+                            help='Обнулить счётчики после вывода')
+
+    def handle(self, *args, **options):
+        if is_process_local_cache() or isinstance(get_cache(), DummyCache):
+            raise CommandError(
+                'Счётчики хранятся в кэше API, а он не общий для процессов '
+                '(CACHE_BACKEND): команда их не увидит. Используйте общий '
+                'бэкенд кэша, например FileBasedCache.')
+        stats = get_stats(options['prefix'])
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total * 100 if total else 0
+        self.stdout.write(f'Попаданий: {stats["hits"]}\n'
+                          f'Промахов: {stats["misses"]}\n'
+                          f'Доля попаданий: {ratio:.1f}%')
+        if options['reset']:
+            reset_stats(options['prefix'])
@@ -0,0 +1,399 @@
+import asyncio
+from collections import Counter
+import json
+import re
+import secrets
+from time import monotonic, perf_counter
+from typing import NamedTuple
+from urllib.parse import quote, urlsplit
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from api.management.benchmarks import percentiles
+from recipes.models import User
+
+# Верхние границы интервалов гистограммы задержек, мс
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# Переменные коллекции, уникальные для каждого прохода сценария
+UNIQUE_VARIABLES = ('username', 'email', 'secondUserUsername',
+                    'secondUserEmail', 'thirdUserUsername', 'thirdUserEmail')
+VARIABLE = re.compile(r'{{(\w+)}}')
+EXPECTED_STATUS = re.compile(r'Статус-код[^"]*?(\d{3})')
+SET_VARIABLE = re.compile(
+    r'collectionVariables\.set\(["\'](\w+)["\'],\s*(.+)\);?$')
+GET_VALUE = re.compile(r'const (\w+) = _\.get\(responseData, "([\w.]+)"\)')
+EXPRESSION = re.compile(r'\[(\d+)\]|\.slice\((\d+),\s*(\d+)\)|\.(\w+)')
+
+
+class Step(NamedTuple):
+    """Запрос коллекции, подготовленный к повторению."""
+
+    name: str
+    method: str
+    url: str
+    headers: dict
+    body: str
+    expected: int | None
+    extract: tuple
+
+
+def load_collection(path):
+    """Запросы Postman-коллекции в порядке выполнения и значения
+    её переменных. Из тестовых скриптов берутся ожидаемый код ответа
+    и переменные, которые скрипты сохраняют из ответа."""
+    with open(path, encoding='U8') as ofl:
+        collection = json.load(ofl)
+    variables = {variable['key']: variable['value']
+                 for variable in collection.get('variable', ())}
+    return list(iter_steps(collection['item'], collection.get('auth'))), \
+        variables
+
+
+def iter_steps(items, auth):
+    for item in items:
+        if 'item' in item:
+            yield from iter_steps(item['item'], item.get('auth') or auth)
+            continue
+        request = item['request']
+        headers = {header['key']: header['value']
+                   for header in request.get('header', ())
+                   if not header.get('disabled')}
+        request_auth = request.get('auth') or auth
+        if request_auth and request_auth['type'] == 'apikey':
+            apikey = {pair['key']: pair['value']
+                      for pair in request_auth['apikey']}
+            headers[apikey['key']] = apikey['value']
+        body = request.get('body', {}).get('raw', '')
+        if body:
+            headers.setdefault('Content-Type', 'application/json')
+        script = '\n'.join(
+            line for event in item.get('event', ())
+            if event['listen'] == 'test'
+            for line in event['script']['exec']
+        )
+        expected = EXPECTED_STATUS.search(script)
+        aliases = dict(GET_VALUE.findall(script))
+        extract = tuple(
+            (match[1], aliases.get(match[2], match[2]))
+            for match in map(SET_VARIABLE.search,
+                             map(str.strip, script.splitlines()))
+            if match
+        )
+        url = request['url']
+        yield Step(
+            name=item['name'],
+            method=request['method'],
+            url=url['raw'] if isinstance(url, dict) else url,
+            headers=headers,
+            body=body,
+            expected=int(expected[1]) if expected else None,
+            extract=extract,
+        )
+
+
+def evaluate(expression, data):
+    """Значение выражения скрипта вида responseData[0].name.slice(0,1)
+    или пути из _.get(responseData, "id"), None при его отсутствии."""
+    expression = expression.removeprefix('responseData')
+    if not expression.startswith(('[', '.')):
+        expression = f'.{expression}'
+    try:
+        for index, start, stop, key in EXPRESSION.findall(expression):
+            if index:
+                data = data[int(index)]
+            elif key:
+                data = data[key]
+            else:
+                data = data[int(start):int(stop)]
+    except (LookupError, TypeError):
+        return None
+    return data
+
+
+def make_unique(value, marker):
+    """Значение переменной (строка JSON) с меткой прохода сценария:
+    для адресов почты - в имени ящика, иначе - в конце строки."""
+    value = json.loads(value)
+    if '@' in value:
+        mailbox, domain = value.split('@', 1)
+        return json.dumps(f'{mailbox}-{marker}@{domain}')
+    return json.dumps(f'{value}-{marker}')
+
+
+class HTTPClient:
+    """Клиент HTTP/1.1 на потоках asyncio с постоянным соединением."""
+
+    def __init__(self, url, timeout):
+        self.scheme = url.scheme
+        self.host = url.hostname
+        self.port = url.port or (443 if url.scheme == 'https' else 80)
+        self.netloc = url.netloc
+        self.timeout = timeout
+        self.reader = self.writer = None
+
+    async def request(self, method, path, headers, body):
+        for reused in (self.writer is not None, False):
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.wait_for(
+                    asyncio.open_connection(
+                        self.host, self.port, ssl=self.scheme == 'https'),
+                    self.timeout)
+            try:
+                return await asyncio.wait_for(
+                    self.exchange(method, path, headers, body), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                # Сервер мог закрыть простаивающее соединение.
+                if not reused:
+                    raise
+            except BaseException:
+                self.close()
+                raise
+
+    async def exchange(self, method, path, headers, body):
+        head = [f'{method} {path} HTTP/1.1', f'Host: {self.netloc}',
+                f'Content-Length: {len(body)}',
+                *(f'{name}: {value}' for name, value in headers.items())]
+        self.writer.write(
+            ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError('Соединение закрыто сервером')
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while (line := await self.reader.readline()).strip():
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+        if 'chunked' in response_headers.get('transfer-encoding', ''):
+            content = bytearray()
+            while size := int((await self.reader.readline()).split(b';')[0],
+                              16):
+                content += await self.reader.readexactly(size)
+                await self.reader.readline()
+            while (await self.reader.readline()).strip():
+                pass
+        elif 'content-length' in response_headers:
+            content = await self.reader.readexactly(
+                int(response_headers['content-length']))
+        elif status in (204, 304) or method == 'HEAD':
+            content = b''
+        else:
+            content = await self.reader.read()
+            self.close()
+        connection = response_headers.get('connection', '').lower()
+        if connection == 'close' or (
+                status_line.startswith(b'HTTP/1.0')
+                and connection != 'keep-alive'):
+            self.close()
+        return status, bytes(content)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Command(BaseCommand):
+    """Класс команды нагрузочного тестирования API по Postman-коллекции"""
+
+    help = ('Повторение сценария Postman-коллекции одновременными '
+            'виртуальными пользователями против запущенного сервера: '
+            'пропускная способность, доля ошибок и гистограммы задержек '
+            'по каждому запросу')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='http://127.0.0.1:8000',
+            help='Адрес сервера (gunicorn или runserver)',
+        )
+        parser.add_argument(
+            '--collection',
+            default=settings.BASE_DIR.parent / 'postman_collection'
+            / 'foodgram.postman_collection.json',
+            help='Путь к файлу Postman-коллекции',
+        )
+        parser.add_argument(
+            '--users', type=int, default=10,
+            help='Количество одновременных виртуальных пользователей',
+        )
+        parser.add_argument(
+            '--iterations', type=int, default=1,
+            help='Количество проходов сценария каждым пользователем',
+        )
+        parser.add_argument(
+            '--duration', type=float, default=None,
+            help='Повторять сценарий указанное число секунд '
+                 'вместо --iterations',
+        )
+        parser.add_argument(
+            '--ramp-up', type=float, default=0,
+            help='За сколько секунд запустить всех пользователей',
+        )
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument(
+            '--json', default=None,
+            help='Записать результаты в json-файл для сравнения запусков',
+        )
+        parser.add_argument(
+            '--cleanup', action='store_true',
+            help='Удалить созданных сценарием пользователей из БД '
+                 '(если сервер работает с той же БД)',
+        )
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme not in ('http', 'https') or not url.hostname:
+            raise CommandError(f'Некорректный адрес сервера: {url.geturl()}')
+        try:
+            steps, variables = load_collection(options['collection'])
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f'Коллекция не прочитана:\n*** {e}')
+        # Запросы отправляются по пути, сервер задаётся параметром --url.
+        variables['baseUrl'] = url.path.rstrip('/')
+        self.options = options
+        self.url = url
+        self.run_id = secrets.token_hex(3)
+        self.timings = {step.name: [] for step in steps}
+        self.errors = {step.name: Counter() for step in steps}
+        self.sent = Counter()
+        started = monotonic()
+        asyncio.run(self.run(steps, variables))
+        elapsed = monotonic() - started
+        self.report(elapsed)
+        if options['cleanup']:
+            deleted, _ = User.objects.filter(
+                username__contains=f'-{self.run_id}-').delete()
+            self.stdout.write(f'Удалено записей: {deleted}')
+
+    async def run(self, steps, variables):
+        deadline = (monotonic() + self.options['duration']
+                    if self.options['duration'] else None)
+        delay = self.options['ramp_up'] / max(self.options['users'], 1)
+        await asyncio.gather(*(
+            self.virtual_user(number, steps, variables, number * delay,
+                              deadline)
+            for number in range(self.options['users'])
+        ))
+
+    async def virtual_user(self, number, steps, variables, delay, deadline):
+        await asyncio.sleep(delay)
+        client = HTTPClient(self.url, self.options['timeout'])
+        iteration = 0
+        try:
+            while True:
+                marker = f'{self.run_id}-{number}-{iteration}'
+                values = {
+                    **variables,
+                    **{name: make_unique(variables[name], marker)
+                       for name in UNIQUE_VARIABLES if name in variables},
+                }
+                for step in steps:
+                    await self.send(client, step, values)
+                iteration += 1
+                if deadline is None:
+                    if iteration >= self.options['iterations']:
+                        break
+                elif monotonic() >= deadline:
+                    break
+        finally:
+            client.close()
+
+    async def send(self, client, step, values):
+        def substitute(text):
+            return VARIABLE.sub(
+                lambda match: str(values.get(match[1], match[0])), text)
+
+        path = quote(substitute(step.url), safe="/?&=:@%+,;")
+        headers = {name: substitute(value)
+                   for name, value in step.headers.items()}
+        self.sent[step.name] += 1
+        started = perf_counter()
+        try:
+            status, content = await client.request(
+                step.method, path, headers, substitute(step.body).encode())
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+                ValueError, IndexError) as e:
+            self.errors[step.name][type(e).__name__] += 1
+            return
+        self.timings[step.name].append(perf_counter() - started)
+        if step.expected is not None and status != step.expected:
+            self.errors[step.name][f'{status} вместо {step.expected}'] += 1
+        elif step.expected is None and status >= 500:
+            self.errors[step.name][str(status)] += 1
+        if not step.extract:
+            return
+        try:
+            data = json.loads(content)
+        except ValueError:
+            return
+        for variable, expression in step.extract:
+            value = evaluate(expression, data)
+            if value is not None:
+                values[variable] = value
+
+    def histogram(self, timings):
+        counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        for timing in timings:
+            index = 0
+            while (index < len(LATENCY_BUCKETS)
+                   and timing * 1000 > LATENCY_BUCKETS[index]):
+                index += 1
+            counts[index] += 1
+        return counts
+
+    def report(self, elapsed):
+        results = {}
+        for name, timings in self.timings.items():
+            errors = sum(self.errors[name].values())
+            count = self.sent[name]
+            p50, p95, p99 = percentiles(timings) if timings else (0, 0, 0)
+            results[name] = {
+                'requests': count,
+                'throughput': count / elapsed,
+                'errors': errors,
+                'error_rate': errors / count if count else 0,
+                'p50': p50, 'p95': p95, 'p99': p99,
+                'histogram': self.histogram(timings),
+                'error_kinds': dict(self.errors[name]),
+            }
+        total = sum(result['requests'] for result in results.values())
+        errors = sum(result['errors'] for result in results.values())
+        width = max(map(len, results), default=0)
+        self.stdout.write(
+            f'{"Запрос":<{width}}  {"кол-во":>7}  {"зап/с":>7}  '
+            f'{"ошибки":>7}  {"p50 мс":>8}  {"p95 мс":>8}  {"p99 мс":>8}')
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<{width}}  {result["requests"]:7}  '
+                f'{result["throughput"]:7.1f}  '
+                f'{result["error_rate"]:7.1%}  {result["p50"]:8.1f}  '
+                f'{result["p95"]:8.1f}  {result["p99"]:8.1f}')
+        edges = [f'≤{edge}' for edge in LATENCY_BUCKETS] + [
+            f'>{LATENCY_BUCKETS[-1]}']
+        self.stdout.write(
+            f'\nГистограммы задержек, мс\n{"Запрос":<{width}}  '
+            + ' '.join(f'{edge:>6}' for edge in edges))
+        for name, result in results.items():
+            self.stdout.write(f'{name:<{width}}  ' + ' '.join(
+                f'{count:6}' for count in result['histogram']))
+        for name, result in results.items():
+            for kind, number in result['error_kinds'].items():
+                self.stderr.write(f'{name}: {kind} - {number}')
+        self.stdout.write(
+            f'\nПользователей: {self.options["users"]}, запросов: {total} '
+            f'за {elapsed:.1f} с ({total / elapsed:.1f} запросов/с), '
+            f'ошибок: {errors} ({errors / max(total, 1):.1%})')
+        if self.options['json']:
+            with open(self.options['json'], 'w', encoding='U8') as ofl:
+                json.dump({
+                    'url': self.url.geturl(),
+                    'users': self.options['users'],
+                    'duration': elapsed,
+                    'requests': total,
+                    'throughput': total / elapsed,
+                    'errors': errors,
+                    'buckets': LATENCY_BUCKETS,
+                    'results': results,
+                }, ofl, indent=2, ensure_ascii=False)
@@ -1,4 +1,4 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class QueryPageNumberPagination(PageNumberPagination):
@@ -6,3 +6,33 @@ class QueryPageNumberPagination(PageNumberPagination):
 
     page_size_query_param = 'limit'
     page_size = 6
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Курсорная пагинация ленты рецептов по (-pub_date, id)
+    без OFFSET и подсчёта общего количества записей."""
+
+    page_size_query_param = 'limit'
+    page_size = 6
+    ordering = ('-pub_date', 'id',)
+
+
+class RecipePagination(QueryPageNumberPagination):
+    """Пагинация ленты рецептов: по номерам страниц по умолчанию,
+    курсорная - при наличии в запросе параметра cursor."""
+
+    cursor_pagination_class = RecipeCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if (self.cursor_pagination_class.cursor_query_param
+                not in request.query_params):
+            return super().paginate_queryset(queryset, request, view)
+        self.cursor_paginator = self.cursor_pagination_class()
+        return self.cursor_paginator.paginate_queryset(
+            queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is None:
+            return super().get_paginated_response(data)
+        return self.cursor_paginator.get_paginated_response(data)
@@ -0,0 +1,174 @@
+import base64
+import binascii
+import json
+import re
+
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.utils.datastructures import MultiValueDict
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+CHUNK_SIZE = 64 * 1024
+# Начало строки, по которому распознаётся data URI
+HEAD_SIZE = 128
+DATA_URI = re.compile(rb'^data:([\w.+-]+/[\w.+-]+)?;base64,')
+STRING_END = re.compile(rb'["\\]')
+ESCAPE = re.compile(rb'\\(?:u[0-9a-fA-F]{4}|[^u])')
+PLACEHOLDER = '\0upload{}'
+
+
+class StreamingJSONParser(JSONParser):
+    """Разбор JSON без загрузки тела запроса в память целиком.
+    Строки вида data:<тип>;base64,... декодируются по частям во временные
+    файлы и заменяются в данных объектами TemporaryUploadedFile,
+    остальной документ разбирается обычным json.loads."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        scanner = DataURIScanner()
+        try:
+            while chunk := stream.read(CHUNK_SIZE):
+                scanner.feed(chunk)
+            data = json.loads(scanner.close())
+        except (ValueError, binascii.Error) as exc:
+            scanner.discard()
+            raise ParseError(f'JSON parse error - {exc}')
+        request = (parser_context or {}).get('request')
+        if request is not None and scanner.files:
+            # Как и для multipart, Django закроет файлы по окончании запроса.
+            request._request._files = MultiValueDict(
+                {name: [upload] for name, upload in scanner.files.items()})
+        return replace_uploads(data, scanner.files)
+
+
+def replace_uploads(data, files):
+    """Подстановка файлов на место заполнителей в разобранных данных."""
+    if isinstance(data, dict):
+        return {key: replace_uploads(value, files)
+                for key, value in data.items()}
+    if isinstance(data, list):
+        return [replace_uploads(value, files) for value in data]
+    if isinstance(data, str) and data.startswith('\0'):
+        return files.get(data, data)
+    return data
+
+
+def unescape_base64(match):
+    """Экранированный символ внутри base64: переводы строк (как в выводе
+    base64.encodebytes) отбрасываются, \\/ и \\u002f заменяются символом."""
+    char = json.loads(b'"' + match.group() + b'"')
+    return b'' if char.isspace() else char.encode('ascii')
+
+
+class DataURIScanner:
+    """Конечный автомат над байтами JSON: вне строки, начало строки,
+    остаток обычной строки и содержимое data URI в base64."""
+
+    def __init__(self):
+        self.output = bytearray()
+        self.files = {}
+        self.state = self.outside
+        self.head = bytearray()
+        self.escaped = False
+        self.file = None
+        self.tail = b''
+        self.escape = b''
+
+    def feed(self, chunk):
+        position = 0
+        while position < len(chunk):
+            position = self.state(chunk, position)
+
+    def close(self):
+        if self.state != self.outside:
+            raise ValueError('Unterminated string')
+        return self.output.decode()
+
+    def discard(self):
+        if self.file is not None:
+            self.file.close()
+        for upload in self.files.values():
+            upload.close()
+
+    def outside(self, chunk, position):
+        end = chunk.find(b'"', position)
+        if end == -1:
+            self.output += chunk[position:]
+            return len(chunk)
+        self.output += chunk[position:end]
+        self.head.clear()
+        self.escaped = False
+        self.state = self.string_head
+        return end + 1
+
+    def string_head(self, chunk, position):
+        for index in range(position, len(chunk)):
+            byte = chunk[index]
+            if self.escaped:
+                self.escaped = False
+            elif byte == ord('\\'):
+                self.escaped = True
+            elif byte == ord('"'):
+                self.output += b'"' + self.head + b'"'
+                self.state = self.outside
+                return index + 1
+            self.head.append(byte)
+            match = DATA_URI.match(self.head)
+            if match:
+                self.start_file(match)
+                return index + 1
+            if len(self.head) >= HEAD_SIZE:
+                self.output += b'"' + self.head
+                self.state = self.string_rest
+                return index + 1
+        return len(chunk)
+
+    def string_rest(self, chunk, position):
+        if self.escaped:
+            self.output.append(chunk[position])
+            self.escaped = False
+            position += 1
+        while match := STRING_END.search(chunk, position):
+            end = match.end()
+            self.output += chunk[position:end]
+            if match.group() == b'"':
+                self.state = self.outside
+                return end
+            if end == len(chunk):
+                self.escaped = True
+                return end
+            self.output.append(chunk[end])
+            position = end + 1
+        self.output += chunk[position:]
+        return len(chunk)
+
+    def start_file(self, match):
+        content_type = (match.group(1) or b'').decode()
+        self.file = TemporaryUploadedFile(
+            'upload', content_type or None, 0, None)
+        self.tail = b''
+        self.escape = b''
+        self.state = self.base64
+
+    def base64(self, chunk, position):
+        end = chunk.find(b'"', position)
+        data = self.escape + chunk[position:None if end == -1 else end]
+        self.escape = b''
+        if end == -1:
+            # Экранированный символ может продолжиться в следующей части.
+            split = data.rfind(b'\\', -5)
+            if split != -1 and not ESCAPE.match(data, split):
+                data, self.escape = data[:split], data[split:]
+        data = self.tail + ESCAPE.sub(unescape_base64, data)
+        size = len(data) if end != -1 else len(data) // 4 * 4
+        self.file.write(base64.b64decode(data[:size], validate=True))
+        self.tail = data[size:]
+        if end == -1:
+            return len(chunk)
+        self.file.size = self.file.tell()
+        self.file.seek(0)
+        placeholder = PLACEHOLDER.format(len(self.files))
+        self.files[placeholder] = self.file
+        self.file = None
+        self.output += json.dumps(placeholder).encode()
+        self.state = self.outside
+        return end + 1
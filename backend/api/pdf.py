@@ -0,0 +1,61 @@
+"""Отрисовка списка покупок в PDF.
+
+Модуль выполняется в дочерних процессах пула и не импортирует Django:
+все данные передаются в render_shopping_pdf простыми структурами.
+"""
+import os
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
+
+MARGIN = 20 * mm
+LINE = 7 * mm
+LOGO_SIZE = 25 * mm
+
+
+def register_fonts(fonts_dir):
+    for name in ('Unbounded-Regular', 'Unbounded-Medium'):
+        if name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(name, os.path.join(fonts_dir, f'{name}.ttf')))
+
+
+def render_shopping_pdf(path, static_dir, date, ingredients, recipes):
+    """Сохраняет PDF по пути path: заголовок с логотипом,
+    продукты с количеством и рецепты корзины."""
+    register_fonts(os.path.join(static_dir, 'fonts'))
+    width, height = A4
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    canvas = Canvas(tmp_path, pagesize=A4)
+    canvas.setTitle(f'Список покупок от {date}')
+    canvas.drawImage(
+        os.path.join(static_dir, 'images', 'logo.jpeg'),
+        width - MARGIN - LOGO_SIZE, height - MARGIN - LOGO_SIZE,
+        LOGO_SIZE, LOGO_SIZE, preserveAspectRatio=True,
+    )
+    y = height - MARGIN - LINE
+
+    def write(text, font='Unbounded-Regular', size=11):
+        nonlocal y
+        if y < MARGIN:
+            canvas.showPage()
+            y = height - MARGIN
+        canvas.setFont(font, size)
+        canvas.drawString(MARGIN, y, text)
+        y -= LINE
+
+    write(f'Список покупок (от {date})', 'Unbounded-Medium', 16)
+    y -= LINE
+    write('Продукты:', 'Unbounded-Medium', 13)
+    for n, (name, amount, m_unit) in enumerate(ingredients, 1):
+        write(f'{n:02}. {name.capitalize()} - {amount} {m_unit}')
+    y -= LINE
+    write('Рецепты:', 'Unbounded-Medium', 13)
+    for name, author in recipes:
+        write(f'{name} ({author})')
+    canvas.save()
+    os.replace(tmp_path, path)
+    return path
@@ -1,26 +1,77 @@
 from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import UploadedFile
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser.serializers import UserSerializer
-from drf_extra_fields.fields import Base64ImageField
+from drf_extra_fields.fields import Base64FieldMixin, Base64ImageField
+import filetype
 from rest_framework import serializers
 
-from recipes.constants import MIN_COOK_TIME
-from recipes.models import Tag, Ingredient, Recipe, RecipeIngredient
+from recipes.constants import (AVATAR_VARIANTS, MIN_COOK_TIME,
+                               RECIPE_IMAGE_VARIANTS)
+from recipes.models import (Tag, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingListItem)
+from recipes.variants import variant_urls
 
 User = get_user_model()
 
+RECIPE_INGREDIENTS = Prefetch(
+    'recipeingredients',
+    queryset=RecipeIngredient.objects.select_related(
+        'ingredient').order_by('ingredient__name'),
+)
+
+
+class ImageUploadField(Base64ImageField):
+    """Изображение строкой base64 либо файлом, который StreamingJSONParser
+    уже декодировал на диск. Тип файла проверяется по заголовку."""
+
+    def to_internal_value(self, data):
+        if not isinstance(data, UploadedFile):
+            return super().to_internal_value(data)
+        extension = filetype.guess_extension(data.read(8192))
+        data.seek(0)
+        if extension not in self.ALLOWED_TYPES:
+            raise serializers.ValidationError(self.INVALID_TYPE_MESSAGE)
+        data.name = f'{self.get_file_name(None)}.{extension}'
+        return super(Base64FieldMixin, self).to_internal_value(data)
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии изображения по вариантам."""
+
+    def __init__(self, field, variants, **kwargs):
+        self.field = field
+        self.variants = variants
+        super().__init__(source='*', **kwargs)
+
+    def to_representation(self, instance):
+        urls = variant_urls(getattr(instance, self.field),
+                            getattr(instance, f'{self.field}_variants'),
+                            self.variants)
+        request = self.context.get('request')
+        if urls and request is not None:
+            urls = {variant: request.build_absolute_uri(url)
+                    for variant, url in urls.items()}
+        return urls
+
 
 class FoodgramUserSerializer(UserSerializer):
     """Сериализатор данных модели FoodgramUser."""
 
     is_subscribed = serializers.SerializerMethodField()
-    avatar = Base64ImageField(required=False, allow_null=True)
+    avatar = ImageUploadField(required=False, allow_null=True)
+    avatars = ImageVariantsField('avatar', AVATAR_VARIANTS)
 
     class Meta(UserSerializer.Meta):
         model = User
-        fields = (*UserSerializer.Meta.fields, 'is_subscribed', 'avatar',)
+        fields = (*UserSerializer.Meta.fields, 'is_subscribed', 'avatar',
+                  'avatars',)
         read_only_fields = fields
 
     def get_is_subscribed(self, author):
+        subscriptions = self.context.get('subscriptions')
+        if subscriptions is not None:
+            return author.id in subscriptions
         user = self.context['request'].user
         return user.is_authenticated and user.subscriptions_added.filter(
             author_id=author.id).exists()
@@ -29,7 +80,7 @@ class FoodgramUserSerializer(UserSerializer):
 class AvatarUserSerializer(UserSerializer):
     """Сериализатор данных модели FoodgramUser для смены аватара."""
 
-    avatar = Base64ImageField(required=True,)
+    avatar = ImageUploadField(required=True,)
 
     class Meta(UserSerializer.Meta):
         model = User
@@ -39,9 +90,11 @@ class AvatarUserSerializer(UserSerializer):
 class BriefRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор данных модели Recipe для избранного и корзины."""
 
+    images = ImageVariantsField('image', RECIPE_IMAGE_VARIANTS)
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time',)
+        fields = ('id', 'name', 'image', 'images', 'cooking_time',)
         read_only_fields = fields
 
 
@@ -49,22 +102,29 @@ class UserSubscriptionsSerializer(FoodgramUserSerializer):
     """Сериализатор данных модели пользователя для модели Subscriptions."""
 
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(source='recipes.count')
+    recipes_count = serializers.SerializerMethodField()
 
     class Meta(UserSerializer.Meta):
         model = User
         fields = (*UserSerializer.Meta.fields, 'recipes',
-                  'recipes_count', 'is_subscribed', 'avatar',)
+                  'recipes_count', 'is_subscribed', 'avatar', 'avatars',)
         read_only_fields = fields
 
     def get_recipes(self, user):
-        recipes = user.recipes.all()
-        limit = self.context.get('request').query_params.get(
-            'recipes_limit', None)
-        if limit is not None:
-            recipes = recipes[:int(limit)]
+        recipes = getattr(user, 'recipes_preview', None)
+        if recipes is None:
+            recipes = user.recipes.all()
+            limit = self.context.get('request').query_params.get(
+                'recipes_limit', None)
+            if limit is not None:
+                recipes = recipes[:int(limit)]
         return BriefRecipeSerializer(recipes, many=True).data
 
+    def get_recipes_count(self, user):
+        if hasattr(user, 'recipes_count'):
+            return user.recipes_count
+        return user.recipes.count()
+
 
 class TagSerializer(serializers.ModelSerializer):
     """Сериализатор данных модели Tag."""
@@ -82,41 +142,68 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', )
 
 
+class RecipeIngredientSerializer(serializers.ModelSerializer):
+    """Сериализатор продукта рецепта с количеством."""
+
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit')
+
+    class Meta:
+        model = RecipeIngredient
+        fields = ('id', 'name', 'measurement_unit', 'amount',)
+        read_only_fields = fields
+
+
+class ShoppingListItemSerializer(RecipeIngredientSerializer):
+    """Сериализатор строки списка покупок."""
+
+    class Meta(RecipeIngredientSerializer.Meta):
+        model = ShoppingListItem
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Базовый класс сериализатора модели Recipe."""
 
     author = FoodgramUserSerializer(read_only=True)
     tags = TagSerializer(read_only=True, many=True,)
-    ingredients = IngredientSerializer(read_only=True, many=True,)
+    ingredients = RecipeIngredientSerializer(
+        source='recipeingredients', read_only=True, many=True,)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
-    image = Base64ImageField()
+    image = ImageUploadField()
+    images = ImageVariantsField('image', RECIPE_IMAGE_VARIANTS)
     cooking_time = serializers.IntegerField(min_value=MIN_COOK_TIME)
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time',)
+                  'name', 'image', 'images', 'text', 'cooking_time',)
         required_fields = ('cooking_time',)
 
     def to_representation(self, recipe):
-        amounts = dict(recipe.recipeingredients.values_list(
-            'ingredient_id', 'amount',))
-        recipe = super().to_representation(recipe)
-        for ingredient in recipe['ingredients']:
-            ingredient['amount'] = amounts[ingredient['id']]
-        return recipe
-
-    def get_is_favorited(self, recipe):
+        # Для рецептов из RecipeViewSet продукты уже загружены,
+        # запрос выполняется только после создания или изменения.
+        prefetch_related_objects((recipe,), RECIPE_INGREDIENTS)
+        return super().to_representation(recipe)
+
+    def user_relation_exists(self, recipe, annotation, related_name):
+        """Значение аннотации из RecipeViewSet.get_queryset, либо
+        запрос к БД, если рецепт получен не через представление."""
+        if hasattr(recipe, annotation):
+            return getattr(recipe, annotation)
         user = self.context['request'].user
-        return user.is_authenticated and user.favorites.filter(
+        return user.is_authenticated and getattr(user, related_name).filter(
             recipe_id=recipe.id).exists()
 
+    def get_is_favorited(self, recipe):
+        return self.user_relation_exists(recipe, 'is_favorited', 'favorites')
+
     def get_is_in_shopping_cart(self, recipe):
-        user = self.context['request'].user
-        return user.is_authenticated and user.purchases.filter(
-            recipe_id=recipe.id).exists()
+        return self.user_relation_exists(
+            recipe, 'is_in_shopping_cart', 'purchases')
 
     def validate_image(self, image):
         if not image:
@@ -126,12 +213,15 @@ class RecipeSerializer(serializers.ModelSerializer):
     @staticmethod
     def create_update(recipe, tags, ingredients_amounts):
         recipe.tags.set(tags)
+        before = ShoppingListItem.recipe_amounts(recipe.pk)
         recipe.ingredients.clear()
         RecipeIngredient.objects.bulk_create(
             RecipeIngredient(
                 recipe=recipe, ingredient_id=i[0], amount=i[1],
             ) for i in ingredients_amounts
         )
+        # bulk_create не отправляет сигналы моделей.
+        ShoppingListItem.update_recipe(recipe, before)
         return recipe
 
     def get_check_ingredients_and_tags(self):
@@ -1,25 +1,220 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import csv
 from datetime import datetime
+from hashlib import sha256
+import json
+import logging
+from multiprocessing import get_context
+import os
+from threading import Lock
+from time import time
 
+from django.conf import settings
+from django.db.models import F
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .pdf import render_shopping_pdf
+
+logger = logging.getLogger(__name__)
 
 PRODUCTS = ' {:02}.{} - {}{}'
 RECIPES = ' {} ({})'
+CHUNK_SIZE = 2000
+# Интервал между проверками устаревших файлов PDF, с
+EVICT_INTERVAL = 3600
+
+
+class ShoppingFileRenderer(BaseRenderer):
+    """Рендерер для выбора формата файла списка покупок параметром format
+    или заголовком Accept. Файл формирует генератор из EXPORTERS,
+    через рендерер проходят только ответы с ошибками и ответ 202
+    об отрисовке PDF - они отдаются в JSON с соответствующим типом."""
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = JSONRenderer.media_type
+        return JSONRenderer().render(data)
+
+
+class TextRenderer(ShoppingFileRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
 
+class CSVRenderer(ShoppingFileRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
 
-def save_shopping_file(ingredients, recipes):
-    return '\n'.join([
-        f'Список покупок (от {datetime.now().strftime("%d.%m.%Y")}):',
-        '',
-        'Продукты:',
-        *[PRODUCTS.format(
+
+class JSONFileRenderer(ShoppingFileRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+
+class PDFRenderer(ShoppingFileRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+
+
+def get_rows(user):
+    """Итераторы по строкам списка покупок и рецептам корзины,
+    читающие курсор БД порциями."""
+    ingredients = user.shopping_list.values(
+        'amount',
+        name=F('ingredient__name'),
+        m_unit=F('ingredient__measurement_unit'),
+    ).order_by('ingredient__name').iterator(chunk_size=CHUNK_SIZE)
+    recipes = user.purchases.values(
+        name=F('recipe__name'),
+        author=F('recipe__author__username'),
+    ).order_by('recipe__name').iterator(chunk_size=CHUNK_SIZE)
+    return ingredients, recipes
+
+
+def shopping_txt(ingredients, recipes):
+    yield (f'Список покупок (от {datetime.now().strftime("%d.%m.%Y")}):\n'
+           f'\nПродукты:')
+    for n, i in enumerate(ingredients, 1):
+        yield '\n' + PRODUCTS.format(
             n,
-            i["name"].capitalize(),
-            i["amount"],
-            i["m_unit"]
-        ) for n, i in enumerate(ingredients, 1)],
-        '',
-        'Рецепты:',
-        *[RECIPES.format(
-            r.recipe.name,
-            r.recipe.author.username,
-        ) for r in recipes],
-    ])
+            i['name'].capitalize(),
+            i['amount'],
+            i['m_unit'],
+        )
+    yield '\n\nРецепты:'
+    for r in recipes:
+        yield '\n' + RECIPES.format(r['name'], r['author'])
+
+
+class Echo:
+    """Псевдобуфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_csv(ingredients, recipes):
+    """Таблица продуктов для электронных таблиц. Рецепты корзины в CSV
+    не выводятся: вторая таблица с другими столбцами сделала бы файл
+    непригодным для импорта, поэтому итератор recipes не читается
+    и запрос рецептов не выполняется."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Продукт', 'Количество', 'Единица измерения'))
+    for i in ingredients:
+        yield writer.writerow((i['name'], i['amount'], i['m_unit']))
+
+
+def shopping_json(ingredients, recipes):
+    yield (f'{{"date": "{datetime.now().strftime("%Y-%m-%d")}", '
+           f'"products": [')
+    for n, i in enumerate(ingredients):
+        yield (', ' if n else '') + json.dumps({
+            'name': i['name'],
+            'amount': i['amount'],
+            'measurement_unit': i['m_unit'],
+        }, ensure_ascii=False)
+    yield '], "recipes": ['
+    for n, r in enumerate(recipes):
+        yield (', ' if n else '') + json.dumps(r, ensure_ascii=False)
+    yield ']}'
+
+
+EXPORTERS = {
+    'txt': shopping_txt,
+    'csv': shopping_csv,
+    'json': shopping_json,
+}
+
+
+class PDFStore:
+    """Файлы PDF со списками покупок, закэшированные на диске под хэшем
+    содержимого. Отрисовка выполняется в ограниченном пуле процессов."""
+
+    def __init__(self):
+        self.executor = None
+        self.pending = {}
+        self.lock = Lock()
+        self.evicted = 0
+
+    def get_executor(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=settings.SHOPPING_PDF_WORKERS,
+                mp_context=get_context('spawn'),
+            )
+        return self.executor
+
+    def get(self, user):
+        """Путь к готовому файлу или None, если отрисовка не успела
+        завершиться за SHOPPING_PDF_WAIT секунд (по умолчанию 0 - запрос
+        только ставит отрисовку в очередь)."""
+        date = datetime.now().strftime('%d.%m.%Y')
+        ingredients, recipes = get_rows(user)
+        ingredients = [(i['name'], i['amount'], i['m_unit'])
+                       for i in ingredients]
+        recipes = [(r['name'], r['author']) for r in recipes]
+        digest = sha256(json.dumps(
+            (date, ingredients, recipes), ensure_ascii=False,
+        ).encode()).hexdigest()
+        path = os.path.join(settings.SHOPPING_PDF_ROOT, f'{digest}.pdf')
+        if os.path.exists(path):
+            return path
+        with self.lock:
+            future = self.pending.get(digest)
+            if future is None:
+                os.makedirs(settings.SHOPPING_PDF_ROOT, exist_ok=True)
+                self.evict()
+                future = self.get_executor().submit(
+                    render_shopping_pdf, path,
+                    str(settings.BASE_DIR / 'api' / 'static' / 'api'),
+                    date, ingredients, recipes,
+                )
+                self.pending[digest] = future
+                future.add_done_callback(
+                    lambda future: self.done(future, digest))
+        try:
+            return future.result(timeout=settings.SHOPPING_PDF_WAIT)
+        except TimeoutError:
+            return None
+
+    def done(self, future, digest):
+        """Ошибки отрисовки записываются в журнал, а не только в ответ
+        ожидающего запроса; после падения процесса пул пересоздаётся."""
+        self.pending.pop(digest, None)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is None:
+            return
+        logger.error('Не удалось сформировать PDF списка покупок',
+                     exc_info=error)
+        if isinstance(error, BrokenProcessPool):
+            self.executor = None
+
+    def evict(self):
+        """Удаление файлов старше SHOPPING_PDF_MAX_AGE секунд, не чаще
+        раза в EVICT_INTERVAL: дата входит в ключ кэша, и файлы прошлых
+        дней больше не запрашиваются. Возвращает число удалённых файлов."""
+        now = time()
+        if now - self.evicted < EVICT_INTERVAL:
+            return 0
+        self.evicted = now
+        expired = now - settings.SHOPPING_PDF_MAX_AGE
+        removed = 0
+        with os.scandir(settings.SHOPPING_PDF_ROOT) as entries:
+            for entry in entries:
+                if (entry.name.endswith(('.pdf', '.tmp'))
+                        and entry.stat().st_mtime < expired):
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        continue
+                    removed += 1
+        return removed
+
+
+pdf_store = PDFStore()
@@ -0,0 +1,50 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import (Favorite, Ingredient, Purchase, Recipe,
+                            RecipeIngredient, Subscription, Tag)
+from recipes.versions import invalidate, invalidate_reference
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_recipes(**kwargs):
+    """Сброс кэша рецептов при изменении данных, входящих в ответы."""
+    invalidate('recipes')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_tags_and_ingredients(**kwargs):
+    """Сброс версии справочников тегов и продуктов."""
+    invalidate_reference()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_recipes_by_author(update_fields=None, **kwargs):
+    """Сброс кэша рецептов при изменении данных авторов
+    (кроме обновления даты последнего входа)."""
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    invalidate('recipes')
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=Purchase)
+@receiver(post_delete, sender=Purchase)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_user(instance, **kwargs):
+    """Сброс версии данных пользователя: избранного, корзины, подписок."""
+    invalidate(f'user{instance.user_id}')
@@ -0,0 +1,275 @@
+import base64
+from io import BytesIO, StringIO
+import json
+import os
+import shutil
+import tempfile
+from time import time
+import tracemalloc
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile, UploadedFile
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APITestCase
+
+from recipes.models import Ingredient, Tag, User
+from .parsers import StreamingJSONParser
+from .shopping import PDFStore
+
+# PNG 1x2 из Postman-коллекции
+IMAGE = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieyw'
+         'aAAAACVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQV'
+         'QImWNoAAAAggCByxOyYQAAAABJRU5ErkJggg==')
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeSearchTests(APITestCase):
+    """Полнотекстовый поиск по рецептам, созданным через API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='cook', email='cook@test.ru')
+        cls.tag = Tag.objects.create(name='Обед', slug='lunch')
+        cls.ingredient = Ingredient.objects.create(
+            name='свёкла', measurement_unit='г')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self, name, text):
+        response = self.client.post('/api/recipes/', {
+            'ingredients': [{'id': self.ingredient.id, 'amount': 300}],
+            'tags': [self.tag.id],
+            'image': IMAGE,
+            'name': name,
+            'text': text,
+            'cooking_time': 60,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def search(self, query):
+        response = self.client.get('/api/recipes/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_created_recipe_is_found(self):
+        borscht = self.create_recipe('Тест борщ', 'Сварить свёклу.')
+        self.create_recipe('Салат', 'Нарезать овощи.')
+        self.assertEqual(self.search('борщ'), [borscht])
+
+    def test_ranked_by_relevance(self):
+        borscht = self.create_recipe('Борщ', 'Борщ со свёклой, борщ.')
+        soup = self.create_recipe(
+            'Суп', 'Суп варится дольше, чем борщ, и без свёклы.')
+        self.assertEqual(self.search('борщ'), [borscht, soup])
+        self.assertEqual(self.search('суп'), [soup])
+
+    def test_updated_and_deleted_recipe(self):
+        recipe = self.create_recipe('Суп', 'Сварить.')
+        response = self.client.patch(f'/api/recipes/{recipe}/', {
+            'ingredients': [{'id': self.ingredient.id, 'amount': 300}],
+            'tags': [self.tag.id],
+            'name': 'Щи',
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.search('суп'), [])
+        self.assertEqual(self.search('щи'), [recipe])
+        self.client.delete(f'/api/recipes/{recipe}/')
+        self.assertEqual(self.search('щи'), [])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class AvatarUploadTests(APITestCase):
+    """Загрузка аватара в base64 и в форме multipart."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='cook', email='cook@test.ru')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_upload_formats(self):
+        png = base64.b64decode(IMAGE.split(',')[1])
+        for name, data, format in (
+            ('json', {'avatar': IMAGE}, 'json'),
+            ('multipart', {'avatar': SimpleUploadedFile(
+                'avatar.png', png, 'image/png')}, 'multipart'),
+        ):
+            with self.subTest(format=name):
+                response = self.client.put(
+                    '/api/users/me/avatar/', data, format=format)
+                self.assertEqual(response.status_code, 200, response.data)
+                self.user.refresh_from_db()
+                with self.user.avatar.open() as avatar:
+                    self.assertEqual(avatar.read(), png)
+
+
+class StreamingJSONParserTests(SimpleTestCase):
+    """Разбор JSON с изображением в base64 при ограниченной памяти."""
+
+    # Размер изображения в теле запроса ~8 МБ в base64
+    IMAGE_SIZE = 6 * 1024 * 1024
+    PEAK_LIMIT = 1024 * 1024
+
+    def test_large_image_peak_memory(self):
+        image = os.urandom(self.IMAGE_SIZE)
+        body = json.dumps({
+            'name': 'Рецепт',
+            'image': 'data:image/png;base64,'
+                     + base64.b64encode(image).decode(),
+        }).encode()
+        stream = BytesIO(body)
+        tracemalloc.start()
+        try:
+            data = StreamingJSONParser().parse(stream)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        upload = data['image']
+        self.addCleanup(upload.close)
+        self.assertLess(peak, self.PEAK_LIMIT)
+        self.assertIsInstance(upload, UploadedFile)
+        self.assertEqual(upload.content_type, 'image/png')
+        self.assertEqual(upload.size, self.IMAGE_SIZE)
+        self.assertEqual(upload.read(), image)
+        self.assertEqual(data['name'], 'Рецепт')
+
+    def test_escaped_base64(self):
+        image = os.urandom(1000)
+        # base64.encodebytes разбивает строку переводами строк
+        escaped = json.dumps(base64.encodebytes(image).decode())[1:-1]
+        bodies = {
+            name: f'{{"image": "{IMAGE[:22]}{value}"}}'
+            for name, value in (
+                ('newlines', escaped),
+                ('slashes', escaped.replace('/', '\\/')),
+                ('unicode', escaped.replace('\\n', '\\u000a')
+                 .replace('/', '\\u002f')),
+            )
+        }
+        # Экранированные символы на границах частей тела запроса
+        for chunk_size in (1, 2, 3, 5, 7, 64 * 1024):
+            for name, body in bodies.items():
+                with self.subTest(body=name, chunk_size=chunk_size), \
+                        mock.patch('api.parsers.CHUNK_SIZE', chunk_size):
+                    upload = StreamingJSONParser().parse(
+                        BytesIO(body.encode()))['image']
+                    self.addCleanup(upload.close)
+                    self.assertEqual(upload.read(), image)
+
+
+class PDFStoreEvictionTests(SimpleTestCase):
+    """Удаление устаревших файлов PDF списков покупок."""
+
+    def test_evict_expired_files(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        now = time()
+        for name, age in (('old.pdf', 3 * 86400), ('fresh.pdf', 3600),
+                          ('old.pdf.1.tmp', 3 * 86400),
+                          ('old.txt', 3 * 86400)):
+            path = os.path.join(root, name)
+            open(path, 'wb').close()
+            os.utime(path, (now - age, now - age))
+        store = PDFStore()
+        with self.settings(SHOPPING_PDF_ROOT=root,
+                           SHOPPING_PDF_MAX_AGE=2 * 86400):
+            self.assertEqual(store.evict(), 2)
+            self.assertEqual(sorted(os.listdir(root)),
+                             ['fresh.pdf', 'old.txt'])
+            os.utime(os.path.join(root, 'fresh.pdf'), (0, 0))
+            # Повторная проверка не раньше чем через EVICT_INTERVAL.
+            self.assertEqual(store.evict(), 0)
+            store.evicted = 0
+            self.assertEqual(store.evict(), 1)
+
+
+class PDFStoreTests(TestCase):
+    """Отрисовка PDF не задерживает запрос."""
+
+    def test_get_does_not_wait(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        user = User.objects.create(username='cook', email='cook@test.ru')
+        store = PDFStore()
+        with self.settings(SHOPPING_PDF_ROOT=root, SHOPPING_PDF_WORKERS=1):
+            self.addCleanup(lambda: store.executor.shutdown())
+            self.assertIsNone(store.get(user))
+            for future in list(store.pending.values()):
+                future.result(timeout=60)
+            path = store.get(user)
+        self.assertEqual(os.path.dirname(path), root)
+        self.assertTrue(os.path.exists(path))
+
+
+class ReferenceETagTests(APITestCase):
+    """Строгие ETag сжатого и несжатого списков тегов и продуктов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name='Обед', slug='lunch')
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+
+    def test_etag_depends_on_content_encoding(self):
+        for url in ('/api/tags/', '/api/ingredients/'):
+            with self.subTest(url=url):
+                plain = self.client.get(url)
+                gzipped = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+                self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+                self.assertNotIn('Content-Encoding', plain)
+                self.assertNotEqual(plain['ETag'], gzipped['ETag'])
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=gzipped['ETag'])
+                self.assertEqual(response.status_code, 200)
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=gzipped['ETag'],
+                    HTTP_ACCEPT_ENCODING='gzip')
+                self.assertEqual(response.status_code, 304)
+
+
+class ShoppingCartDownloadTests(APITestCase):
+    """Ошибки скачивания списка покупок отдаются в JSON, а не с типом
+    запрошенного файла."""
+
+    def test_unauthenticated_error_is_json(self):
+        for file_format in ('txt', 'csv', 'json', 'pdf'):
+            with self.subTest(format=file_format):
+                response = self.client.get(
+                    '/api/recipes/download_shopping_cart/',
+                    {'format': file_format})
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(response['Content-Type'],
+                                 'application/json')
+                self.assertIn('detail', json.loads(response.content))
+
+
+class CacheStatsTests(SimpleTestCase):
+    """Статистика кэша доступна только при общем для процессов кэше."""
+
+    def test_process_local_cache(self):
+        with self.assertRaises(CommandError):
+            call_command('cachestats', stdout=StringIO())
+
+    def test_shared_cache(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        backend = 'django.core.cache.backends.filebased.FileBasedCache'
+        with override_settings(CACHES={
+                'default': {'BACKEND': backend, 'LOCATION': location}}):
+            out = StringIO()
+            call_command('cachestats', stdout=out)
+        self.assertIn('Попаданий: 0', out.getvalue())
@@ -1,13 +1,22 @@
+import os
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import F, Sum
-from django.http import Http404, FileResponse
+from django.db.models import Count, Exists, OuterRef, Prefetch, Value
+from django.http import (FileResponse, Http404, HttpResponse,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import content_disposition_header, http_date
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status, filters
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.permissions import (IsAuthenticated,
                                         IsAuthenticatedOrReadOnly, AllowAny)
 from rest_framework.response import Response
@@ -15,20 +24,174 @@ from rest_framework.viewsets import ReadOnlyModelViewSet, ModelViewSet
 
 from recipes.models import (Tag, Ingredient, Recipe,
                             Favorite, Purchase, Subscription, )
-from .filters import RecipeFilter, IngredientFilter
+from .cache import (count_event, get_cache, get_response_key,
+                    get_validators, JSONSnapshot, PrefixIndex)
+from .filters import RecipeFilter
+from .pagination import RecipePagination
+from .parsers import StreamingJSONParser
 from .permissions import AuthorOrReadOnly
 from .serializers import (TagSerializer, IngredientSerializer,
                           UserSubscriptionsSerializer,
                           FoodgramUserSerializer,
                           BriefRecipeSerializer, RecipeSerializer,
-                          AvatarUserSerializer, )
-from .shopping import save_shopping_file
+                          AvatarUserSerializer, ShoppingListItemSerializer,
+                          RECIPE_INGREDIENTS, )
+from .shopping import (CSVRenderer, EXPORTERS, get_rows, JSONFileRenderer,
+                       pdf_store, PDFRenderer, TextRenderer)
 
 
 User = get_user_model()
+# Изображения в base64 разбираются потоково, формы - как и прежде
+UPLOAD_PARSERS = (StreamingJSONParser, FormParser, MultiPartParser)
+
+
+class SubscriptionsContextMixin:
+    """Миксин, добавляющий в контекст сериализатора множество id авторов,
+    на которых подписан пользователь. Множество загружается одним
+    запросом при первом обращении и используется всеми вложенными
+    сериализаторами пользователя."""
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        user = self.request.user
+        context['subscriptions'] = SimpleLazyObject(
+            lambda: set(user.subscriptions_added.values_list(
+                'author_id', flat=True))
+            if user.is_authenticated else set()
+        )
+        return context
+
+
+class ConditionalGetMixin:
+    """Миксин условных GET-запросов для list и retrieve: ETag и
+    Last-Modified по версиям разделов, ответ 304 до работы сериализаторов."""
+
+    cache_prefixes = ()
+    per_user = False
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def conditional_response(self, method, request, *args, **kwargs):
+        etag, last_modified = get_validators(
+            self.cache_prefixes, request, self.per_user,
+            self.get_content_encoding(request))
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = method(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response.headers.setdefault('ETag', etag)
+        response.headers.setdefault('Last-Modified', http_date(last_modified))
+        patch_cache_control(response, no_cache=True)
+        if self.per_user:
+            patch_vary_headers(response, ('Authorization',))
+            if request.user.is_authenticated:
+                patch_cache_control(response, private=True)
+        return response
+
+    def get_content_encoding(self, request):
+        """Content-Encoding будущего ответа: у сжатого и несжатого
+        представлений строгие ETag должны различаться. Задаётся
+        миксинами, которые отдают сжатые ответы."""
+        parent = super()
+        if hasattr(parent, 'get_content_encoding'):
+            return parent.get_content_encoding(request)
+        return ''
+
+
+class SnapshotListMixin:
+    """Миксин ответа на запрос полного списка без параметров заранее
+    отрисованным JSON без обращения к ORM и сериализаторам."""
+
+    snapshot = None
+
+    def uses_snapshot(self, request):
+        return (self.action == 'list' and not request.query_params
+                and request.accepted_renderer.format == 'json')
+
+    def get_content_encoding(self, request):
+        if (self.uses_snapshot(request)
+                and 'gzip' in request.headers.get('Accept-Encoding', '')):
+            return 'gzip'
+        return ''
+
+    def list(self, request, *args, **kwargs):
+        if not self.uses_snapshot(request):
+            return super().list(request, *args, **kwargs)
+        content, gzipped = self.snapshot.get(
+            lambda: self.get_serializer(self.get_queryset(), many=True).data)
+        if self.get_content_encoding(request) == 'gzip':
+            response = HttpResponse(gzipped, content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(content, content_type='application/json')
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+class AutocompleteMixin:
+    """Миксин автодополнения по названию через индекс в памяти воркера.
+    Количество результатов ограничено параметром limit."""
 
+    autocomplete_param = 'name'
+    autocomplete_index = None
+    autocomplete_limit = 20
+    autocomplete_max_limit = 100
 
-class FoodgramUserViewSet(UserViewSet):
+    def list(self, request, *args, **kwargs):
+        query = request.query_params.get(self.autocomplete_param)
+        if query is None:
+            return super().list(request, *args, **kwargs)
+        return Response(self.autocomplete_index.search(
+            lambda: self.get_serializer(self.get_queryset(), many=True).data,
+            query, self.get_autocomplete_limit(request),
+        ))
+
+    def get_autocomplete_limit(self, request):
+        try:
+            limit = int(request.query_params['limit'])
+        except (KeyError, ValueError):
+            return self.autocomplete_limit
+        return min(max(limit, 1), self.autocomplete_max_limit)
+
+
+class AnonymousCacheMixin:
+    """Миксин кэширования ответов list и retrieve для анонимных
+    пользователей. Кэш сбрасывается сигналами из api.signals."""
+
+    cache_prefix = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, method, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return method(request, *args, **kwargs)
+        key = get_response_key(self.cache_prefix, request)
+        data = get_cache().get(key)
+        if data is not None:
+            count_event(self.cache_prefix, 'hits')
+            return Response(data, headers={'X-Cache': 'HIT'})
+        count_event(self.cache_prefix, 'misses')
+        response = method(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            get_cache().set(key, response.data, settings.API_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
+
+
+class FoodgramUserViewSet(SubscriptionsContextMixin, UserViewSet):
     """Представление модели пользователя."""
 
     http_method_names = ('get', 'post', 'put', 'delete',)
@@ -55,22 +218,34 @@ class FoodgramUserViewSet(UserViewSet):
                                   f'{author.username}')
         return Response(
             UserSubscriptionsSerializer(
-                author, context={'request': request},).data,
+                author, context=self.get_serializer_context(),).data,
             status=status.HTTP_201_CREATED,
         )
 
     @action(('get',), detail=False, permission_classes=(IsAuthenticated,),)
     def subscriptions(self, request):
         """Метод просмотра подписок."""
+        recipes = Recipe.objects.all()
+        limit = request.query_params.get('recipes_limit', None)
+        if limit is not None:
+            # Срез в Prefetch выполняется одним запросом с ROW_NUMBER()
+            # по каждому автору.
+            recipes = recipes[:int(limit)]
         page = self.paginate_queryset(
+            User.objects.filter(
+                subscriptions_recieved__user=request.user,
+            ).annotate(
+                recipes_count=Count('recipes'),
+            ).order_by('username').prefetch_related(
+                Prefetch('recipes', queryset=recipes,
+                         to_attr='recipes_preview'),
+            )
+        )
+        return self.get_paginated_response(
             UserSubscriptionsSerializer(
-                User.objects.filter(
-                    id__in=request.user.subscriptions_added.values('author'),),
-                many=True,
-                context={'request': request},
+                page, many=True, context=self.get_serializer_context(),
             ).data
         )
-        return self.get_paginated_response(page)
 
     @action(
         ('get',),
@@ -83,11 +258,15 @@ class FoodgramUserViewSet(UserViewSet):
     @action(
         ('put', 'delete'), url_path='me/avatar',
         detail=False, permission_classes=(IsAuthenticated, AuthorOrReadOnly,),
+        parser_classes=UPLOAD_PARSERS,
     )
     def avatar(self, request, *args, **kwargs):
         """Метод добавления и удаления аватара."""
         if request.method == 'DELETE':
-            request.user.avatar.delete()
+            # Файл не удаляется: тот же файл может быть аватаром
+            # другого пользователя или изображением рецепта.
+            request.user.avatar = None
+            request.user.save(update_fields=('avatar',))
             return Response(status=status.HTTP_204_NO_CONTENT)
         serializer = AvatarUserSerializer(request.user, data=request.data)
         if serializer.is_valid():
@@ -97,38 +276,64 @@ class FoodgramUserViewSet(UserViewSet):
             serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(ConditionalGetMixin, SnapshotListMixin,
+                 ReadOnlyModelViewSet):
     """Представление модели тэга."""
 
     queryset = Tag.objects.all()
     permission_classes = (AllowAny,)
     serializer_class = TagSerializer
     pagination_class = None
+    cache_prefixes = ('reference',)
+    snapshot = JSONSnapshot('reference')
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, AutocompleteMixin,
+                        SnapshotListMixin, ReadOnlyModelViewSet):
     """Представление модели продукта."""
 
     queryset = Ingredient.objects.all()
     permission_classes = (AllowAny,)
     serializer_class = IngredientSerializer
-    filter_backends = (filters.SearchFilter, DjangoFilterBackend,)
-    filterset_class = IngredientFilter
+    filter_backends = (filters.SearchFilter,)
     search_fields = ('^name',)
     pagination_class = None
+    cache_prefixes = ('reference',)
+    snapshot = JSONSnapshot('reference')
+    autocomplete_index = PrefixIndex('reference')
 
 
-class RecipeViewSet(ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, AnonymousCacheMixin,
+                    SubscriptionsContextMixin, ModelViewSet):
     """Представление модели рецепта."""
 
     http_method_names = ('get', 'post', 'patch', 'delete',)
     permission_classes = (IsAuthenticatedOrReadOnly, AuthorOrReadOnly,)
-    queryset = Recipe.objects.all().prefetch_related(
-        'ingredients', 'recipeingredients', 'tags', 'author')
+    queryset = Recipe.objects.select_related('author').prefetch_related(
+        RECIPE_INGREDIENTS, 'tags')
     serializer_class = RecipeSerializer
+    parser_classes = UPLOAD_PARSERS
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    pagination_class = RecipePagination
     lookup_url_kwarg = 'id'
+    cache_prefix = 'recipes'
+    cache_prefixes = ('recipes', 'reference',)
+    per_user = True
+
+    def get_queryset(self):
+        user = self.request.user
+        if not user.is_authenticated:
+            return self.queryset.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+            )
+        return self.queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(Purchase.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+        )
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
@@ -166,25 +371,55 @@ class RecipeViewSet(ModelViewSet):
             request, Purchase, request.user.purchases.all(), id)
 
     @action(('get',), detail=False,
-            permission_classes=(IsAuthenticated,),)
+            permission_classes=(IsAuthenticated,),
+            renderer_classes=(TextRenderer, CSVRenderer, JSONFileRenderer,
+                              PDFRenderer,),)
     def download_shopping_cart(self, request, *args, **kwargs):
-        """Метод вывода списка покупок в файл."""
-        ingredients = request.user.purchases.prefetch_related(
-            'recipe', 'recipe__ingredients', 'recipe__recipeingredients',
-        ).values(
-            name=F('recipe__ingredients__name'),
-            m_unit=F('recipe__ingredients__measurement_unit'),
-        ).annotate(
-            amount=Sum('recipe__recipeingredients__amount'),
-        ).order_by('recipe__ingredients__name')
-        recipes = request.user.purchases.prefetch_related(
-            'recipe', 'recipe__author'
-        )
-        return FileResponse(
-            save_shopping_file(ingredients, recipes),
-            'shopping.txt'
+        """Метод вывода списка покупок в файл
+        (?format=txt|csv|json|pdf)."""
+        file_format = request.accepted_renderer.format
+        if file_format == 'pdf':
+            return self.shopping_pdf_response(request)
+        return StreamingHttpResponse(
+            EXPORTERS[file_format](*get_rows(request.user)),
+            content_type=f'{request.accepted_renderer.media_type}; '
+                         f'charset=utf-8',
+            headers={'Content-Disposition': content_disposition_header(
+                True, f'shopping.{file_format}')},
         )
 
+    @staticmethod
+    def shopping_pdf_response(request):
+        """Готовый PDF отдаётся через X-Accel-Redirect (если задан
+        SHOPPING_PDF_ACCEL_PREFIX) или FileResponse; пока файл
+        отрисовывается - ответ 202 с Retry-After."""
+        path = pdf_store.get(request.user)
+        if path is None:
+            return Response(
+                {'detail': 'Список покупок готовится, повторите запрос.'},
+                status=status.HTTP_202_ACCEPTED,
+                headers={'Retry-After': '1'},
+            )
+        if settings.SHOPPING_PDF_ACCEL_PREFIX:
+            return HttpResponse(content_type='application/pdf', headers={
+                'Content-Disposition': content_disposition_header(
+                    True, 'shopping.pdf'),
+                'X-Accel-Redirect': (settings.SHOPPING_PDF_ACCEL_PREFIX
+                                     + os.path.basename(path)),
+            })
+        return FileResponse(open(path, 'rb'), as_attachment=True,
+                            filename='shopping.pdf')
+
+    @action(('get',), detail=False,
+            permission_classes=(IsAuthenticated,),)
+    def shopping_list(self, request, *args, **kwargs):
+        """Метод просмотра списка покупок."""
+        return Response(ShoppingListItemSerializer(
+            request.user.shopping_list.select_related(
+                'ingredient').order_by('ingredient__name'),
+            many=True,
+        ).data)
+
     @action(('get',), url_path='get-link',
             detail=True, permission_classes=(AllowAny,),)
     def get_link(self, request, id):
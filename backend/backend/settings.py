@@ -95,6 +95,20 @@ DATABASES = {
 }
 
 
+# Версии данных для кэша ответов и ETag хранятся в кэше: воркерам gunicorn
+# и командам загрузки данных нужен общий бэкенд (FileBasedCache, Redis).
+# LocMemCache по умолчанию подходит только для разработки и тестов.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'pisheblog'),
+    }
+}
+
+API_CACHE_ALIAS = 'default'
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', 600))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -130,6 +144,25 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+STORAGES = {
+    'default': {
+        'BACKEND': 'recipes.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+# 0 - уменьшенные копии изображений создаются в процессе веб-сервера
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 1))
+
+SHOPPING_PDF_ROOT = os.getenv('SHOPPING_PDF_ROOT', BASE_DIR / 'shopping_pdf')
+SHOPPING_PDF_ACCEL_PREFIX = os.getenv('SHOPPING_PDF_ACCEL_PREFIX', '')
+SHOPPING_PDF_WORKERS = int(os.getenv('SHOPPING_PDF_WORKERS', 2))
+# Ожидание отрисовки PDF в запросе, с: по умолчанию запрос не занимает
+# воркер, клиент получает 202 и повторяет запрос через Retry-After
+SHOPPING_PDF_WAIT = float(os.getenv('SHOPPING_PDF_WAIT', 0))
+# Срок хранения файлов PDF, с
+SHOPPING_PDF_MAX_AGE = int(os.getenv('SHOPPING_PDF_MAX_AGE', 2 * 86400))
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -1,14 +1,20 @@
 from admin_decorators import short_description
 from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import Group
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
 from django.utils.safestring import mark_safe
 
 from .filters import (HasRecipes, HasSubscriptions, HasFollowers,
                       IsInRecipe, IsInFavorites, CookTimeFilter, titled_filter)
-from ..models import Tag, Ingredient, Recipe, Subscription, Favorite, Purchase
+from ..constants import AVATAR_VARIANTS, RECIPE_IMAGE_VARIANTS
+from ..models import (Tag, Ingredient, Recipe, RecipeIngredient,
+                      Subscription, Favorite, Purchase, ShoppingListItem)
+from ..variants import variant_urls
 
 User = get_user_model()
 
@@ -16,15 +22,30 @@ admin.site.empty_value_display = 'Не задано'
 admin.site.unregister(Group)
 
 
+def related_count(model, field):
+    """Подзапрос количества связанных записей. В отличие от Count по связи
+    не размножает строки при нескольких счётчиках в одном запросе."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by()
+        .values(field).annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
 class RecipesCountMixin:
     """Миксин для добавления поля с количеством рецептов
-    и ограничения выдачи."""
+    и ограничения выдачи. В recipes_relation задаются модель и поле,
+    связывающие рецепты с объектом."""
 
     list_display = ('recipes_count',)
+    recipes_relation = (Recipe, 'author')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            recipes_total=related_count(*self.recipes_relation))
 
-    @admin.display(description='Рецептов',)
+    @admin.display(description='Рецептов', ordering='recipes_total',)
     def recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_total
 
 
 @admin.register(User)
@@ -42,6 +63,12 @@ class FoodgramUserAdmin(RecipesCountMixin, UserAdmin):
     list_per_page = 8
     show_facets = admin.ShowFacets.NEVER
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            subscriptions_total=related_count(Subscription, 'user'),
+            followers_total=related_count(Subscription, 'author'),
+        )
+
     def get_fieldsets(self, request, obj=None):
         fieldsets = super().get_fieldsets(request, obj)
         fieldsets[1][1]['fields'] = fieldsets[1][1]['fields'] + ('avatar',)
@@ -51,18 +78,19 @@ class FoodgramUserAdmin(RecipesCountMixin, UserAdmin):
     def full_name(self, user):
         return f'{user.last_name} {user.first_name}'
 
-    @admin.display(description='Подписок',)
+    @admin.display(description='Подписок', ordering='subscriptions_total',)
     def subscriptions_count(self, user):
-        return user.subscriptions_added.count()
+        return user.subscriptions_total
 
-    @admin.display(description='Подписчиков',)
+    @admin.display(description='Подписчиков', ordering='followers_total',)
     def followers_count(self, user):
-        return user.subscriptions_recieved.count()
+        return user.followers_total
 
     def get_avatar(self, user):
         if not user.avatar:
             return '/static/recipes/admin/ava_default.jpg'
-        return user.avatar.url
+        return variant_urls(
+            user.avatar, user.avatar_variants, AVATAR_VARIANTS)['small']
 
     @short_description('Аватар')
     @mark_safe
@@ -77,6 +105,7 @@ class TagAdmin(RecipesCountMixin, admin.ModelAdmin):
     list_display = ('name', 'slug', *RecipesCountMixin.list_display,)
     search_fields = ('name', 'slug',)
     list_per_page = 15
+    recipes_relation = (Recipe.tags.through, 'tag')
 
 
 @admin.register(Ingredient)
@@ -89,17 +118,74 @@ class IngredientAdmin(RecipesCountMixin, admin.ModelAdmin):
     search_fields = ('name', 'measurement_unit',)
     list_per_page = 15
     show_facets = admin.ShowFacets.NEVER
-
-
-class TagsInline(admin.TabularInline):
+    recipes_relation = (RecipeIngredient, 'ingredient')
+
+
+class SelectedAutocompleteSelect(AutocompleteSelect):
+    """Виджет autocomplete, выбранное значение которого можно передать
+    готовым объектом в selected вместо запроса к БД."""
+
+    selected = None
+
+    def optgroups(self, name, value, attr=None):
+        if self.selected is None or str(self.selected.pk) not in value:
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        options.append(self.create_option(
+            name, self.selected.pk,
+            self.choices.field.label_from_instance(self.selected),
+            True, len(options),
+        ))
+        return [(None, options, 0)]
+
+
+class AutocompleteInlineMixin:
+    """Миксин для inline с autocomplete_fields: текущие значения полей
+    загружаются вместе со строками одним запросом, а на странице
+    выводятся только они, без списка всех вариантов."""
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            *self.autocomplete_fields)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.autocomplete_fields:
+            kwargs['widget'] = SelectedAutocompleteSelect(
+                db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def get_formset(self, request, obj=None, **kwargs):
+        fields = self.autocomplete_fields
+
+        class FormSet(super().get_formset(request, obj, **kwargs)):
+            def _construct_form(self, i, **kwargs):
+                form = super()._construct_form(i, **kwargs)
+                if form.instance.pk is not None:
+                    # Родительский объект уже загружен, строкам он нужен
+                    # для вывода названия.
+                    setattr(form.instance, self.fk.name, self.instance)
+                    for field in fields:
+                        widget = form.fields[field].widget
+                        getattr(widget, 'widget', widget).selected = getattr(
+                            form.instance, field)
+                return form
+
+        return FormSet
+
+
+class TagsInline(AutocompleteInlineMixin, admin.TabularInline):
     model = Recipe.tags.through
+    autocomplete_fields = ('tag',)
     extra = 0
     verbose_name = Tag._meta.verbose_name
     verbose_name_plural = Tag._meta.verbose_name_plural
 
 
-class IngredientInline(admin.TabularInline):
+class IngredientInline(AutocompleteInlineMixin, admin.TabularInline):
     model = Recipe.ingredients.through
+    autocomplete_fields = ('ingredient',)
     extra = 0
     verbose_name = Ingredient._meta.verbose_name
     verbose_name_plural = Ingredient._meta.verbose_name_plural
@@ -122,19 +208,32 @@ class RecipeAdmin(admin.ModelAdmin):
     list_per_page = 8
     show_facets = admin.ShowFacets.NEVER
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'author',
+        ).prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.order_by('name')),
+            Prefetch('recipeingredients',
+                     queryset=RecipeIngredient.objects.select_related(
+                         'ingredient').order_by('ingredient__name')),
+        ).annotate(favorites_total=related_count(Favorite, 'recipe'))
+
+    def save_related(self, request, form, formsets, change):
+        before = ShoppingListItem.recipe_amounts(form.instance.pk)
+        super().save_related(request, form, formsets, change)
+        ShoppingListItem.update_recipe(form.instance, before)
+
     @short_description('Продукты')
     @mark_safe
     def ingredients_list(self, recipe):
         return '<br>'.join(
             f'{i.ingredient.name} - {i.amount}{i.ingredient.measurement_unit}'
-            for i in recipe.recipeingredients.all().order_by(
-                'ingredient__name',
-            )
+            for i in recipe.recipeingredients.all()
         )
 
-    @admin.display(description='В избранном',)
+    @admin.display(description='В избранном', ordering='favorites_total',)
     def followers(self, recipe):
-        return recipe.favorites.count()
+        return recipe.favorites_total
 
     @admin.display(description='Автор',)
     def author_name(self, recipe):
@@ -143,7 +242,8 @@ class RecipeAdmin(admin.ModelAdmin):
     def get_image(self, recipe):
         if not recipe.image:
             return settings.STATIC_ROOT / 'recipes' / 'admin' / 'not-found.png'
-        return recipe.image.url
+        return variant_urls(recipe.image, recipe.image_variants,
+                            RECIPE_IMAGE_VARIANTS)['thumb']
 
     @short_description('Изображение')
     @mark_safe
@@ -167,6 +267,9 @@ class SubscriptionAdmin(admin.ModelAdmin):
     ordering = ('user__last_name',)
     list_per_page = 15
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user', 'author')
+
     @staticmethod
     def get_user_info(user):
         return f'{user.last_name} {user.first_name} ({user.id})'
@@ -195,6 +298,9 @@ class UserFavoriteBaseAdmin(admin.ModelAdmin):
     ordering = ('user__last_name',)
     list_per_page = 8
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user', 'recipe')
+
     @admin.display(description='ФИО пользователя',)
     def user_name(self, favorite):
         return f'{favorite.user.first_name} {favorite.user.last_name}'
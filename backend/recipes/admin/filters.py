@@ -1,20 +1,31 @@
 from django.contrib import admin
+from django.db import connection
+from django.db.models import Aggregate, Count, Exists, OuterRef
+
+from ..models import Favorite, Recipe, RecipeIngredient, Subscription
+from ..versions import get_cache, get_version
+
+# Время хранения границ фильтра по времени приготовления, секунд
+TERTILES_TIMEOUT = 60
 
 
 class SubsFilterBase(admin.SimpleListFilter):
-    """Базовый класс для фильтров."""
+    """Базовый класс для фильтров. В related задаются модель и поле,
+    по которым подзапрос EXISTS ищет связанные записи."""
 
     LOOK_UPS = [(1, 'Да'), (0, 'Нет')]
+    related = None
 
     def lookups(self, request, model_admin):
         return self.LOOK_UPS
 
     def queryset(self, request, queryset):
+        model, field = self.related
+        exists = Exists(model.objects.filter(**{field: OuterRef('pk')}))
         if self.value() == '1':
-            return queryset.filter(
-                **{f'{self.parameter_name}__isnull': False}).distinct()
+            return queryset.filter(exists)
         elif self.value() == '0':
-            return queryset.filter(**{f'{self.parameter_name}__isnull': True})
+            return queryset.filter(~exists)
 
 
 class HasRecipes(SubsFilterBase):
@@ -22,6 +33,7 @@ class HasRecipes(SubsFilterBase):
 
     title = 'Есть рецепты'
     parameter_name = 'recipes'
+    related = (Recipe, 'author')
 
 
 class HasSubscriptions(SubsFilterBase):
@@ -29,6 +41,7 @@ class HasSubscriptions(SubsFilterBase):
 
     title = 'Есть подписки'
     parameter_name = 'subscriptions_added'
+    related = (Subscription, 'user')
 
 
 class HasFollowers(SubsFilterBase):
@@ -36,6 +49,7 @@ class HasFollowers(SubsFilterBase):
 
     title = 'Есть подписчики'
     parameter_name = 'subscriptions_recieved'
+    related = (Subscription, 'author')
 
 
 class IsInRecipe(SubsFilterBase):
@@ -43,6 +57,7 @@ class IsInRecipe(SubsFilterBase):
 
     title = 'Есть в рецептах'
     parameter_name = 'recipes'
+    related = (RecipeIngredient, 'ingredient')
 
 
 class IsInFavorites(SubsFilterBase):
@@ -50,6 +65,41 @@ class IsInFavorites(SubsFilterBase):
 
     title = 'Добавлен в избранное'
     parameter_name = 'favorites'
+    related = (Favorite, 'recipe')
+
+
+class PercentileDisc(Aggregate):
+    """Агрегат percentile_disc(<доля>) WITHIN GROUP (ORDER BY <поле>)."""
+
+    function = 'PERCENTILE_DISC'
+    template = ('%(function)s(%(fraction)s) '
+                'WITHIN GROUP (ORDER BY %(expressions)s)')
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+
+def get_tertiles(queryset, field):
+    """Границы трёх равных по числу записей групп значений поля.
+    На Postgres считаются агрегатом percentile_disc, на других СУБД -
+    выборкой одного значения со смещением по отсортированному полю."""
+    if connection.vendor == 'postgresql':
+        limits = queryset.aggregate(
+            count=Count('pk'),
+            lower=PercentileDisc(field, 1 / 3),
+            upper=PercentileDisc(field, 2 / 3),
+        )
+        if limits['count'] < 3:
+            return None
+        return limits['lower'], limits['upper']
+    count = queryset.count()
+    if count < 3:
+        return None
+    values = queryset.order_by(field).values_list(field, flat=True)
+    # Индекс значения, как у percentile_disc: первое значение, доля
+    # записей до которого включительно не меньше заданной.
+    return (values[(count + 2) // 3 - 1],
+            values[(2 * count + 2) // 3 - 1])
 
 
 class CookTimeFilter(admin.SimpleListFilter):
@@ -57,14 +107,17 @@ class CookTimeFilter(admin.SimpleListFilter):
 
     title = 'Время (мин)'
     parameter_name = 'time'
+    lower_limit = upper_limit = None
 
     def lookups(self, request, model_admin):
-        queryset = model_admin.model.objects.all()
-        times = sorted(set(queryset.values_list('cooking_time', flat=True)))
-        if len(times) < 3:
+        key = f'admin:cook_time:{get_version("recipes")}'
+        tertiles = get_cache().get_or_set(
+            key, lambda: get_tertiles(
+                model_admin.model.objects.all(), 'cooking_time'),
+            TERTILES_TIMEOUT)
+        if tertiles is None:
             return []
-        self.lower_limit = times[len(times) // 3]
-        self.upper_limit = times[len(times) // 3 * 2]
+        self.lower_limit, self.upper_limit = tertiles
         return [
             (0, f'< {self.lower_limit}мин.'),
             (1, f'{self.lower_limit} - {self.upper_limit}мин.'),
@@ -72,6 +125,8 @@ class CookTimeFilter(admin.SimpleListFilter):
         ]
 
     def queryset(self, request, queryset):
+        if self.lower_limit is None:
+            return queryset
         if self.value() == '0':
             return queryset.filter(cooking_time__lt=self.lower_limit)
         elif self.value() == '1':
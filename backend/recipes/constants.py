@@ -18,3 +18,15 @@ IF_ANON = 'Без ФИО'
 
 MIN_COOK_TIME = 1
 MIN_AMOUNT = 1
+
+# Уменьшенные копии изображений: вариант - (ширина, высота, обрезка)
+RECIPE_IMAGE_VARIANTS = {
+    'thumb': (140, 140, True),
+    'card': (600, 480, True),
+    'detail': (1200, 1200, False),
+}
+AVATAR_VARIANTS = {
+    'small': (70, 70, True),
+    'medium': (200, 200, True),
+}
+IMAGE_VARIANT_QUALITY = 80
@@ -0,0 +1,62 @@
+"""Создание уменьшенных копий изображений. Модуль не зависит от Django
+и импортируется в процессах пула, в которых Django не настроен."""
+from hashlib import sha1
+import os
+import posixpath
+from uuid import uuid4
+
+from PIL import Image, ImageOps
+
+VARIANTS_DIR = 'variants'
+VARIANT_FORMAT = 'webp'
+
+
+def variant_name(name, variant, size, quality):
+    """Имя файла копии в хранилище, однозначно задаваемое оригиналом
+    и параметрами копии: при их изменении копия получает новый адрес
+    и не берётся из кэша браузеров и nginx."""
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    params = sha1(repr((*size, quality, VARIANT_FORMAT)).encode())
+    return posixpath.join(
+        directory, VARIANTS_DIR,
+        f'{stem}_{variant}_{params.hexdigest()[:8]}.{VARIANT_FORMAT}')
+
+
+def save_atomic(image, path, quality):
+    """Запись во временный файл с уникальным именем и замена им копии:
+    одно изображение могут одновременно обрабатывать несколько процессов
+    (сервер и команда makevariants)."""
+    tmp_path = f'{path}.{uuid4().hex}.tmp'
+    try:
+        image.save(tmp_path, 'WEBP', quality=quality, method=4)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def make_variants(media_root, name, variants, quality):
+    """Сохраняет копии изображения в WebP без метаданных, с учётом
+    ориентации из EXIF. Возвращает словарь вариант - имя файла."""
+    result = {}
+    with Image.open(os.path.join(media_root, name)) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            transparent = ('A' in image.getbands()
+                           or 'transparency' in image.info)
+            image = image.convert('RGBA' if transparent else 'RGB')
+        for variant, size in variants.items():
+            width, height, crop = size
+            if crop:
+                copy = ImageOps.fit(
+                    image, (width, height), Image.Resampling.LANCZOS)
+            else:
+                copy = image.copy()
+                copy.thumbnail((width, height), Image.Resampling.LANCZOS)
+            result[variant] = variant_name(name, variant, size, quality)
+            path = os.path.join(media_root, result[variant])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            save_atomic(copy, path, quality)
+    return result
@@ -1,26 +1,143 @@
 import json
+from time import monotonic
 
 from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import DatabaseError, transaction
+
+from recipes.versions import invalidate_reference, is_process_local_cache
+
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array(file, chunk_size=CHUNK_SIZE):
+    """Элементы JSON-массива из файла по одному. В памяти находится
+    только прочитанная часть файла, ещё не разобранная в элементы."""
+    decoder = json.JSONDecoder()
+    buffer, position, started = '', 0, False
+    while True:
+        chunk = file.read(chunk_size)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and (
+                    buffer[position].isspace() or buffer[position] in ',['):
+                if buffer[position] == '[':
+                    if started:
+                        break
+                    started = True
+                position += 1
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise
+                break
+            if end == len(buffer) and chunk:
+                # Число в конце буфера может продолжаться в следующей части.
+                break
+            if not started:
+                raise ValueError('Файл должен содержать массив JSON.')
+            yield item
+            position = end
+        if not chunk:
+            raise ValueError('Массив JSON не закрыт.')
+
+
+def warn_local_cache(command):
+    """Предупреждение о том, что сброс кэша из команды не дойдёт
+    до запущенного сервера."""
+    if is_process_local_cache():
+        command.stderr.write(command.style.WARNING(
+            'Кэш API хранится в памяти процесса (CACHE_BACKEND), сервер '
+            'продолжит отдавать прежние ответы до перезапуска. '
+            'Используйте общий бэкенд кэша, например FileBasedCache.'))
 
 
 class GetDataFromFileBase(BaseCommand):
-    """Базовый класс для команд загрузки данных из json в БД"""
+    """Базовый класс для команд загрузки данных из json в БД.
+    Файл читается потоково и загружается пакетами в одной транзакции:
+    новые записи добавляются, у найденных по unique_fields обновляются
+    поля update_fields, совпадающие записи пропускаются."""
+
+    unique_fields = ()
+    update_fields = ()
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file', default=None,
+            help=f'Путь к json-файлу, по умолчанию data/{self.filename}.json',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество записей в одном запросе',
+        )
 
     def handle(self, *args, **options):
+        path = options['file'] or (
+            settings.BASE_DIR / 'data' / f'{self.filename}.json')
+        self.counts = dict.fromkeys(('inserted', 'updated', 'skipped'), 0)
+        started = monotonic()
         try:
-            with open(
-                    settings.BASE_DIR / 'data' / f'{self.filename}.json',
-                    'r', encoding='U8',
-            ) as ofl:
-                old_len = self.model.objects.all().count()
-                self.model.objects.bulk_create(
-                    [self.model(**i) for i in json.load(ofl)],
-                    ignore_conflicts=True,
-                )
-                print(f'В таблицу {self.model._meta.verbose_name_plural} '
-                      f'добавлено {self.model.objects.all().count() - old_len}'
-                      f' записей!\n')
-        except Exception as e:
-            print(f'В таблице "{self.model._meta.verbose_name_plural}" данные '
-                  f'не обновлены\n в связи с возникшей ошибкой:\n*** {e}\n')
+            with open(path, 'r', encoding='U8') as ofl, transaction.atomic():
+                batch = []
+                for row in iter_json_array(ofl):
+                    batch.append(self.model(**row))
+                    if len(batch) >= options['batch_size']:
+                        self.save_batch(batch)
+                        batch = []
+                if batch:
+                    self.save_batch(batch)
+        except (OSError, ValueError, TypeError, DatabaseError) as e:
+            raise CommandError(
+                f'В таблице "{self.model._meta.verbose_name_plural}" данные '
+                f'не обновлены в связи с возникшей ошибкой:\n*** {e}')
+        # bulk_create не отправляет сигналы моделей.
+        invalidate_reference()
+        warn_local_cache(self)
+        elapsed = monotonic() - started
+        total = sum(self.counts.values())
+        self.stdout.write(
+            f'{self.model._meta.verbose_name_plural}: добавлено '
+            f'{self.counts["inserted"]}, обновлено {self.counts["updated"]}, '
+            f'пропущено {self.counts["skipped"]} за {elapsed:.2f} с '
+            f'({total / max(elapsed, 1e-6):.0f} записей/с)')
+
+    def get_key(self, obj):
+        return tuple(getattr(obj, field) for field in self.unique_fields)
+
+    def get_values(self, obj):
+        return tuple(getattr(obj, field) for field in self.update_fields)
+
+    def save_batch(self, batch):
+        # Повтор ключа внутри одного INSERT ... ON CONFLICT недопустим,
+        # остаётся последняя запись с этим ключом.
+        objects = {self.get_key(obj): obj for obj in batch}
+        self.counts['skipped'] += len(batch) - len(objects)
+        existing = {
+            self.get_key(obj): self.get_values(obj)
+            for obj in self.model.objects.filter(**{
+                f'{self.unique_fields[0]}__in':
+                    {key[0] for key in objects}
+            }).only(*self.unique_fields, *self.update_fields)
+        }
+        changed = []
+        for key, obj in objects.items():
+            if key not in existing:
+                self.counts['inserted'] += 1
+            elif self.update_fields and existing[key] != self.get_values(obj):
+                self.counts['updated'] += 1
+            else:
+                self.counts['skipped'] += 1
+                continue
+            changed.append(obj)
+        if self.update_fields:
+            self.model.objects.bulk_create(
+                changed, update_conflicts=True,
+                unique_fields=self.unique_fields,
+                update_fields=self.update_fields,
+            )
+        else:
+            self.model.objects.bulk_create(changed, ignore_conflicts=True)
@@ -8,3 +8,5 @@ class Command(GetDataFromFileBase):
     help = 'Импорт продуктов из json-файла в БД'
     filename = 'ingredients'
     model = Ingredient
+    # Все поля продукта входят в unique_ingredient: обновлять нечего.
+    unique_fields = ('name', 'measurement_unit',)
@@ -0,0 +1,61 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from recipes.constants import IMAGE_VARIANT_QUALITY
+from recipes.images import make_variants
+from recipes.management.base2db import warn_local_cache
+from recipes.variants import IMAGE_FIELDS, expected_variants, image_pipeline
+
+
+class Command(BaseCommand):
+    """Класс команды на создание недостающих копий изображений"""
+
+    help = 'Создание уменьшенных копий изображений рецептов и аватаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=max(settings.IMAGE_WORKERS, 1),
+            help='Количество процессов обработки',
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать копии всех изображений',
+        )
+
+    def handle(self, *args, **options):
+        with ProcessPoolExecutor(
+                max_workers=options['workers'],
+                mp_context=get_context('spawn'),
+        ) as executor:
+            for model, field, variants in IMAGE_FIELDS:
+                objects = [
+                    obj for obj in model.objects.exclude(**{field: ''})
+                    .exclude(**{f'{field}__isnull': True})
+                    .only('pk', field, f'{field}_variants').iterator()
+                    if options['all'] or getattr(obj, f'{field}_variants')
+                    != expected_variants(getattr(obj, field), variants)
+                ]
+                futures = [
+                    (obj, executor.submit(
+                        make_variants, settings.MEDIA_ROOT,
+                        getattr(obj, field).name, variants,
+                        IMAGE_VARIANT_QUALITY,
+                    ))
+                    for obj in objects
+                ]
+                failed = 0
+                for obj, future in futures:
+                    name = getattr(obj, field).name
+                    try:
+                        image_pipeline.save(
+                            model, obj.pk, field, name, future.result())
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f'{name}: {e}')
+                self.stdout.write(
+                    f'{model._meta.verbose_name_plural}: обработано '
+                    f'{len(objects) - failed}, ошибок {failed}')
+        warn_local_cache(self)
@@ -0,0 +1,257 @@
+from bisect import bisect
+from datetime import timedelta
+from io import BytesIO
+from itertools import accumulate
+import random
+from time import monotonic
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+
+from recipes.constants import IMAGE_VARIANT_QUALITY, RECIPE_IMAGE_VARIANTS
+from recipes.images import make_variants
+from recipes.management.base2db import warn_local_cache
+from recipes.models import (Favorite, Ingredient, Purchase, Recipe,
+                            RecipeIngredient, ShoppingListItem, Subscription,
+                            Tag, User)
+from recipes.versions import invalidate
+
+SEED_EMAIL_DOMAIN = 'seed.foodgram.local'
+IMAGE_COLORS = ('#e4572e', '#f3a712', '#a8c686', '#669bbc',
+                '#29335c', '#db2b39', '#8f2d56', '#f0c987')
+AMOUNTS = (1, 2, 3, 5, 10, 20, 50, 100, 150, 200, 250, 300, 400, 500)
+DISHES = ('Салат', 'Суп', 'Рагу', 'Запеканка', 'Пирог', 'Омлет',
+          'Паста', 'Каша', 'Соус', 'Десерт', 'Закуска', 'Гарнир')
+WORDS = ('нарезать', 'смешать', 'добавить', 'посолить', 'обжарить',
+         'довести', 'до', 'кипения', 'запекать', 'минут', 'подавать',
+         'горячим', 'охладить', 'перемешать', 'на', 'сковороде', 'в',
+         'духовке', 'и', 'с', 'зеленью', 'по', 'вкусу')
+
+
+def zipf_weights(count, exponent):
+    """Накопленные веса закона Ципфа для выбора с помощью bisect:
+    элемент с рангом r выбирается с вероятностью ~ 1 / r^exponent."""
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    """Класс команды на генерацию синтетических данных"""
+
+    help = ('Генерация пользователей, рецептов, избранного, корзин и '
+            'подписок со степенным распределением популярности')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Среднее количество рецептов в избранном пользователя',
+        )
+        parser.add_argument(
+            '--purchases', type=int, default=3,
+            help='Среднее количество рецептов в корзине пользователя',
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Среднее количество подписок пользователя',
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--password', default='foodgram-seed',
+            help='Пароль всех созданных пользователей',
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        if User.objects.filter(
+                email__endswith=f'@{SEED_EMAIL_DOMAIN}').exists():
+            raise CommandError(
+                'Синтетические данные уже загружены, используйте новую БД.')
+        ingredients = list(
+            Ingredient.objects.order_by('pk').values_list('pk', 'name'))
+        tags = list(Tag.objects.order_by('pk').values_list('pk', flat=True))
+        if not ingredients or not tags:
+            raise CommandError(
+                'Справочники пусты, выполните ing2db и tag2db.')
+        # Популярность продуктов и тегов не зависит от порядка в справочнике.
+        self.random.shuffle(ingredients)
+        self.random.shuffle(tags)
+        self.ingredients = ingredients
+        self.ingredient_weights = zipf_weights(len(ingredients), 1.0)
+        self.tags = tags
+        self.tag_weights = zipf_weights(len(tags), 0.8)
+        self.images = self.make_images()
+        started = monotonic()
+        pub_date = Recipe._meta.get_field('pub_date')
+        try:
+            # Даты публикации распределяются по двум годам, auto_now_add
+            # заменил бы их временем вставки.
+            pub_date.auto_now_add = False
+            with transaction.atomic():
+                self.create_users()
+                self.create_recipes()
+                self.create_relations()
+                with connection.cursor() as cursor:
+                    for sql in connection.ops.sequence_reset_sql(
+                            no_style(), (User, Recipe)):
+                        cursor.execute(sql)
+        finally:
+            pub_date.auto_now_add = True
+        # bulk_create не отправляет сигналы моделей.
+        invalidate('recipes')
+        warn_local_cache(self)
+        self.stdout.write(f'Готово за {monotonic() - started:.1f} с')
+
+    def report(self, name, count, started):
+        elapsed = monotonic() - started
+        self.stdout.write(
+            f'{name}: {count} за {elapsed:.1f} с '
+            f'({count / max(elapsed, 1e-6):.0f} записей/с)')
+
+    def pick(self, items, weights):
+        return items[bisect(weights, self.random.random() * weights[-1])]
+
+    def pick_distinct(self, items, weights, count, exclude=None):
+        """До count разных элементов с учётом весов, без exclude."""
+        count = min(count, len(items) - (exclude is not None))
+        picked = set()
+        for _ in range(count * 4):
+            if len(picked) >= count:
+                break
+            item = self.pick(items, weights)
+            if item != exclude:
+                picked.add(item)
+        return sorted(picked)
+
+    def activity(self, mean):
+        """Число связей пользователя: распределение Парето со средним
+        mean, большинство пользователей малоактивны."""
+        return int(mean * self.random.paretovariate(1.5) / 3)
+
+    def make_images(self):
+        """Несколько изображений-заглушек и их уменьшенные копии,
+        общие для всех рецептов."""
+        images = []
+        for color in IMAGE_COLORS:
+            buffer = BytesIO()
+            Image.new('RGB', (1200, 900), color).save(buffer, 'JPEG')
+            name = default_storage.save(
+                'recipes/images/seed.jpg', ContentFile(buffer.getvalue()))
+            images.append((name, make_variants(
+                settings.MEDIA_ROOT, name, RECIPE_IMAGE_VARIANTS,
+                IMAGE_VARIANT_QUALITY)))
+        return images
+
+    def create_users(self):
+        started = monotonic()
+        first = (User.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        self.user_ids = list(range(first, first + self.options['users']))
+        password = make_password(self.options['password'])
+        users = (
+            User(pk=pk, username=f'seed{pk}',
+                 email=f'seed{pk}@{SEED_EMAIL_DOMAIN}',
+                 first_name=f'Имя{pk}', last_name=f'Фамилия{pk}',
+                 password=password)
+            for pk in self.user_ids
+        )
+        self.bulk_create(User, users)
+        # Авторы тоже распределены по Ципфу: немногие пишут большую часть.
+        self.authors = self.user_ids[:]
+        self.random.shuffle(self.authors)
+        self.author_weights = zipf_weights(len(self.authors), 1.1)
+        self.report('Пользователи', len(self.user_ids), started)
+
+    def create_recipes(self):
+        started = monotonic()
+        first = (Recipe.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        self.recipe_ids = list(range(first, first + self.options['recipes']))
+        now = timezone.now()
+        for offset in range(0, len(self.recipe_ids), self.batch_size):
+            recipes, recipe_ingredients, recipe_tags = [], [], []
+            for pk in self.recipe_ids[offset:offset + self.batch_size]:
+                ingredients = self.pick_distinct(
+                    self.ingredients, self.ingredient_weights,
+                    self.random.randint(3, 12))
+                image, variants = self.random.choice(self.images)
+                recipes.append(Recipe(
+                    pk=pk,
+                    name=f'{self.random.choice(DISHES)} '
+                         f'«{ingredients[0][1]}» №{pk}',
+                    text=' '.join(self.random.choices(
+                        WORDS, k=self.random.randint(20, 120))),
+                    cooking_time=max(
+                        1, int(self.random.lognormvariate(3.2, 0.7))),
+                    author_id=self.pick(self.authors, self.author_weights),
+                    image=image,
+                    image_variants=variants,
+                    pub_date=now - timedelta(
+                        seconds=self.random.randrange(2 * 365 * 86400)),
+                ))
+                recipe_ingredients.extend(
+                    RecipeIngredient(recipe_id=pk, ingredient_id=ingredient,
+                                     amount=self.random.choice(AMOUNTS))
+                    for ingredient, _ in ingredients
+                )
+                recipe_tags.extend(
+                    Recipe.tags.through(recipe_id=pk, tag_id=tag)
+                    for tag in self.pick_distinct(
+                        self.tags, self.tag_weights,
+                        self.random.randint(1, 3))
+                )
+            self.bulk_create(Recipe, recipes)
+            self.bulk_create(RecipeIngredient, recipe_ingredients)
+            self.bulk_create(Recipe.tags.through, recipe_tags)
+        self.report('Рецепты', len(self.recipe_ids), started)
+
+    def create_relations(self):
+        """Избранное, корзины и подписки. Популярность рецептов
+        и авторов подчиняется закону Ципфа, активность пользователей -
+        распределению Парето."""
+        started = monotonic()
+        recipes = self.recipe_ids[:]
+        self.random.shuffle(recipes)
+        recipe_weights = zipf_weights(len(recipes), 1.0)
+        counts = dict.fromkeys((Favorite, Purchase, Subscription), 0)
+        batch_users = max(1, self.batch_size // max(
+            1, self.options['favorites'] + self.options['purchases']
+            + self.options['subscriptions']))
+        for offset in range(0, len(self.user_ids), batch_users):
+            user_ids = self.user_ids[offset:offset + batch_users]
+            rows = {model: [] for model in counts}
+            for user_id in user_ids:
+                for model, option in ((Favorite, 'favorites'),
+                                      (Purchase, 'purchases')):
+                    rows[model].extend(
+                        model(user_id=user_id, recipe_id=recipe_id)
+                        for recipe_id in self.pick_distinct(
+                            recipes, recipe_weights,
+                            self.activity(self.options[option]))
+                    )
+                rows[Subscription].extend(
+                    Subscription(user_id=user_id, author_id=author_id)
+                    for author_id in self.pick_distinct(
+                        self.authors, self.author_weights,
+                        self.activity(self.options['subscriptions']),
+                        exclude=user_id)
+                )
+            for model, objects in rows.items():
+                self.bulk_create(model, objects)
+                counts[model] += len(objects)
+            ShoppingListItem.rebuild(user_ids)
+        for model, count in counts.items():
+            self.report(model._meta.verbose_name_plural, count, started)
+
+    def bulk_create(self, model, objects):
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
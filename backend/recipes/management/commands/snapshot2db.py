@@ -0,0 +1,191 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import shutil
+from time import monotonic
+
+from django.conf import settings
+from django.core import serializers
+from django.core.management import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DatabaseError, connection, models, transaction
+
+from recipes.management.base2db import warn_local_cache
+from recipes.models import ShoppingListItem
+from recipes.versions import invalidate_reference
+
+
+def sort_models(models_list):
+    """Модели в порядке зависимостей: связанная внешним ключом модель
+    загружается раньше ссылающейся на неё."""
+    pending, ordered = list(models_list), []
+    while pending:
+        for model in pending:
+            if not any(
+                field.related_model in pending
+                and field.related_model is not model
+                for field in (*model._meta.concrete_fields,
+                              *model._meta.many_to_many)
+                if field.is_relation
+            ):
+                break
+        else:
+            raise CommandError(
+                f'Циклическая зависимость моделей: {pending}')
+        pending.remove(model)
+        ordered.append(model)
+    return ordered
+
+
+def copy_file(source, destination, link):
+    """Копия или жёсткая ссылка на файл, существующий файл того же
+    размера не перезаписывается."""
+    if (os.path.exists(destination)
+            and os.path.getsize(destination) == os.path.getsize(source)):
+        return False
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    if link:
+        try:
+            if os.path.exists(destination):
+                os.remove(destination)
+            os.link(source, destination)
+            return True
+        except OSError:
+            pass
+    shutil.copyfile(source, destination)
+    return True
+
+
+class Command(BaseCommand):
+    """Класс команды на загрузку снимка БД в формате фикстуры Django"""
+
+    help = ('Быстрая загрузка фикстуры (по умолчанию data/indented_db.json) '
+            'пакетами и копирование изображений в MEDIA_ROOT')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file', default=settings.BASE_DIR / 'data' / 'indented_db.json',
+            help='Путь к файлу фикстуры',
+        )
+        parser.add_argument(
+            '--images', default=settings.BASE_DIR / 'data' / 'images',
+            help='Каталог с файлами изображений фикстуры',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество записей в одном запросе',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='Количество потоков копирования изображений',
+        )
+        parser.add_argument(
+            '--link', action='store_true',
+            help='Создавать жёсткие ссылки вместо копий изображений',
+        )
+
+    def handle(self, *args, **options):
+        started = monotonic()
+        try:
+            with open(options['file'], 'r', encoding='U8') as ofl:
+                objects = list(serializers.deserialize(
+                    'json', ofl, ignorenonexistent=True))
+        except (OSError, serializers.base.DeserializationError) as e:
+            raise CommandError(f'Фикстура не прочитана:\n*** {e}')
+        by_model = {}
+        for deserialized in objects:
+            by_model.setdefault(
+                type(deserialized.object), []).append(deserialized)
+        try:
+            with transaction.atomic():
+                for model in sort_models(by_model):
+                    self.load_model(model, by_model[model], options)
+                with connection.cursor() as cursor:
+                    for sql in connection.ops.sequence_reset_sql(
+                            no_style(), list(by_model)):
+                        cursor.execute(sql)
+                # bulk_create не отправляет сигналы моделей.
+                ShoppingListItem.rebuild()
+        except DatabaseError as e:
+            raise CommandError(f'Данные не загружены:\n*** {e}')
+        invalidate_reference()
+        warn_local_cache(self)
+        loaded = monotonic()
+        copied, total = self.copy_images(objects, options)
+        self.stdout.write(
+            f'Загружено записей: {len(objects)} за {loaded - started:.2f} с, '
+            f'скопировано изображений: {copied} из {total} за '
+            f'{monotonic() - loaded:.2f} с')
+
+    def load_model(self, model, objects, options):
+        """Вставка записей модели с заменой существующих по первичному
+        ключу и связей многие-ко-многим из фикстуры."""
+        instances = [deserialized.object for deserialized in objects]
+        fields = [field.name for field in model._meta.concrete_fields
+                  if not field.primary_key]
+        # bulk_create заменяет значения полей auto_now и auto_now_add
+        # текущим временем, значения из фикстуры записываются отдельно.
+        auto_fields = [
+            field for field in model._meta.concrete_fields
+            if getattr(field, 'auto_now', False)
+            or getattr(field, 'auto_now_add', False)
+        ]
+        values = [[getattr(obj, field.attname) for field in auto_fields]
+                  for obj in instances]
+        model.objects.bulk_create(
+            instances,
+            batch_size=options['batch_size'],
+            update_conflicts=bool(fields),
+            unique_fields=('pk',) if fields else None,
+            update_fields=fields or None,
+            ignore_conflicts=not fields,
+        )
+        if auto_fields:
+            for obj, obj_values in zip(instances, values):
+                for field, value in zip(auto_fields, obj_values):
+                    setattr(obj, field.attname, value)
+            model.objects.bulk_update(
+                instances, [field.name for field in auto_fields],
+                batch_size=options['batch_size'],
+            )
+        for field in model._meta.many_to_many:
+            through = field.remote_field.through
+            if not through._meta.auto_created:
+                # Промежуточные модели загружаются из фикстуры отдельно.
+                continue
+            source = field.m2m_field_name()
+            target = field.m2m_reverse_field_name()
+            through.objects.filter(**{f'{source}__in': [
+                deserialized.object.pk for deserialized in objects
+                if field.name in deserialized.m2m_data
+            ]}).delete()
+            through.objects.bulk_create(
+                [
+                    through(**{f'{source}_id': deserialized.object.pk,
+                               f'{target}_id': pk})
+                    for deserialized in objects
+                    for pk in deserialized.m2m_data.get(field.name, ())
+                ],
+                batch_size=options['batch_size'],
+            )
+
+    def copy_images(self, objects, options):
+        """Параллельное копирование файлов, на которые ссылаются поля
+        изображений загруженных записей."""
+        names = {
+            getattr(deserialized.object, field.name).name
+            for deserialized in objects
+            for field in deserialized.object._meta.concrete_fields
+            if isinstance(field, models.FileField)
+        } - {None, ''}
+        names = [name for name in names
+                 if os.path.exists(os.path.join(options['images'], name))]
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            copied = sum(executor.map(
+                lambda name: copy_file(
+                    os.path.join(options['images'], name),
+                    os.path.join(settings.MEDIA_ROOT, name),
+                    options['link'],
+                ),
+                names,
+            ))
+        return copied, len(names)
@@ -8,3 +8,5 @@ class Command(GetDataFromFileBase):
     help = 'Импорт тегов из json-файла в БД'
     filename = 'recipes_tag'
     model = Tag
+    unique_fields = ('slug',)
+    update_fields = ('name',)
@@ -0,0 +1,106 @@
+from django.db import migrations
+
+# Таблица FTS5 и триггеры, поддерживающие её в актуальном состоянии.
+# Используются также миграцией 0007 и recipes.search для восстановления
+# триггеров, удалённых пересозданием таблицы рецептов.
+SQLITE_SEARCH_OBJECTS = (
+    ('recipes_recipe_fts',
+     "CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5("
+     "name, text, content='recipes_recipe', content_rowid='id')"),
+    ('recipes_recipe_fts_ai',
+     "CREATE TRIGGER recipes_recipe_fts_ai AFTER INSERT "
+     "ON recipes_recipe BEGIN "
+     "INSERT INTO recipes_recipe_fts(rowid, name, text) "
+     "VALUES (new.id, new.name, new.text); END"),
+    ('recipes_recipe_fts_ad',
+     "CREATE TRIGGER recipes_recipe_fts_ad AFTER DELETE "
+     "ON recipes_recipe BEGIN "
+     "INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, "
+     "name, text) VALUES ('delete', old.id, old.name, old.text); END"),
+    ('recipes_recipe_fts_au',
+     "CREATE TRIGGER recipes_recipe_fts_au AFTER UPDATE "
+     "ON recipes_recipe BEGIN "
+     "INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, "
+     "name, text) VALUES ('delete', old.id, old.name, old.text); "
+     "INSERT INTO recipes_recipe_fts(rowid, name, text) "
+     "VALUES (new.id, new.name, new.text); END"),
+)
+SQLITE_SEARCH_REBUILD = (
+    "INSERT INTO recipes_recipe_fts(recipes_recipe_fts) VALUES ('rebuild')")
+
+SEARCH_SQL = {
+    'postgresql': (
+        (
+            "ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector "
+            "GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('russian', coalesce(text, '')), 'B')"
+            ") STORED",
+            "CREATE INDEX recipe_search_vector_idx ON recipes_recipe "
+            "USING gin (search_vector)",
+        ),
+        (
+            "DROP INDEX IF EXISTS recipe_search_vector_idx",
+            "ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector",
+        ),
+    ),
+    'sqlite': (
+        (
+            *(sql for _, sql in SQLITE_SEARCH_OBJECTS),
+            SQLITE_SEARCH_REBUILD,
+        ),
+        (
+            "DROP TRIGGER IF EXISTS recipes_recipe_fts_ai",
+            "DROP TRIGGER IF EXISTS recipes_recipe_fts_ad",
+            "DROP TRIGGER IF EXISTS recipes_recipe_fts_au",
+            "DROP TABLE IF EXISTS recipes_recipe_fts",
+        ),
+    ),
+}
+
+
+def create_missing_search_objects(connection):
+    """Создание недостающих таблицы FTS5 и триггеров на SQLite.
+    Если что-то создавалось, индекс перестраивается по таблице рецептов.
+    Возвращает имена созданных объектов."""
+    if connection.vendor != 'sqlite':
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')"
+            " AND name LIKE 'recipes\\_recipe\\_fts%' ESCAPE '\\'")
+        existing = {name for name, in cursor.fetchall()}
+        created = [name for name, _ in SQLITE_SEARCH_OBJECTS
+                   if name not in existing]
+        for name, sql in SQLITE_SEARCH_OBJECTS:
+            if name in created:
+                cursor.execute(sql)
+        if created:
+            cursor.execute(SQLITE_SEARCH_REBUILD)
+    return created
+
+
+def create_search_index(apps, schema_editor):
+    forward, _ = SEARCH_SQL.get(schema_editor.connection.vendor, ((), ()))
+    for sql in forward:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    _, backward = SEARCH_SQL.get(schema_editor.connection.vendor, ((), ()))
+    for sql in backward:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+    """Полнотекстовый индекс по названию и тексту рецепта:
+    генерируемый столбец tsvector с GIN-индексом на Postgres,
+    таблица FTS5 с триггерами на SQLite."""
+
+    dependencies = [
+        ('recipes', '0002_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
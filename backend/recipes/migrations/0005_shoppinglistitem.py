@@ -0,0 +1,47 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_shopping_lists(apps, schema_editor):
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(user_id=row['recipe__purchases__user'],
+                         ingredient_id=row['ingredient'],
+                         amount=row['total'])
+        for row in RecipeIngredient.objects.filter(
+            recipe__purchases__isnull=False,
+        ).values(
+            'recipe__purchases__user', 'ingredient',
+        ).annotate(total=Sum('amount')).order_by()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_tags_tag_recipe_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.ingredient', verbose_name='Продукт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'строка списка покупок',
+                'verbose_name_plural': 'Списки покупок',
+                'default_related_name': 'shopping_list',
+                'constraints': [models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_item')],
+            },
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+from importlib import import_module
+
+from django.db import migrations
+
+search_migration = import_module('recipes.migrations.0003_recipe_search')
+
+
+def restore_search_index(apps, schema_editor):
+    search_migration.create_missing_search_objects(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    """Триггеры полнотекстового поиска SQLite, удалённые пересозданием
+    таблицы recipes_recipe в 0006_image_variants."""
+
+    dependencies = [
+        ('recipes', '0006_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(restore_search_index, migrations.RunPython.noop),
+    ]
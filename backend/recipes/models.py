@@ -3,8 +3,10 @@ import re
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator, MinValueValidator
-from django.db import models
-from django.db.models import ForeignKey
+from django.db import models, transaction
+from django.db.models import (Case, F, ForeignKey, IntegerField, Sum, Value,
+                              When)
+from django.db.models.functions import Greatest
 
 from . import constants
 from .constants import (USERNAME_VALID, USERNAME_REGEX,
@@ -46,6 +48,12 @@ class FoodgramUser(AbstractUser):
         default=None,
         verbose_name='Аватар',
     )
+    avatar_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Копии аватара',
+    )
 
     class Meta:
         verbose_name = 'пользователь'
@@ -144,6 +152,12 @@ class Recipe(models.Model):
         default=None,
         verbose_name='Изображение',
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Копии изображения',
+    )
     ingredients = models.ManyToManyField(
         Ingredient,
         through='RecipeIngredient',
@@ -163,6 +177,12 @@ class Recipe(models.Model):
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
         default_related_name = 'recipes'
+        indexes = (
+            models.Index(
+                fields=('-pub_date', 'id',),
+                name='recipe_pub_date_id_idx',
+            ),
+        )
 
     def __str__(self):
         return (f'{self.name[:32]} '
@@ -247,6 +267,114 @@ class Purchase(UserFavoriteBase):
         verbose_name_plural = 'Корзины покупок'
 
 
+class ShoppingListItem(models.Model):
+    """Модель строки списка покупок пользователя (суммарное количество
+    продукта по рецептам корзины), таблица recipes_shoppinglistitem."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Продукт',
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+    )
+
+    class Meta:
+        default_related_name = 'shopping_list'
+        verbose_name = 'строка списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient',),
+                name='unique_shopping_list_item',
+            ),
+        )
+
+    def __str__(self):
+        return (f'{self.user.username[:32]} '
+                f'- {self.ingredient.name[:32]} {self.amount}')
+
+    @staticmethod
+    def recipe_amounts(recipe_id):
+        """Количества продуктов рецепта: {id продукта: количество}."""
+        return dict(RecipeIngredient.objects.filter(
+            recipe_id=recipe_id,
+        ).values('ingredient').annotate(
+            total=Sum('amount'),
+        ).order_by().values_list('ingredient', 'total'))
+
+    @classmethod
+    def add_amounts(cls, user_ids, amounts):
+        """Изменение списков покупок пользователей на количества
+        продуктов amounts ({id продукта: количество}, отрицательные
+        вычитаются) без пересчёта по корзинам. Недостающие строки
+        создаются, строки с нулевым количеством удаляются."""
+        amounts = {pk: amount for pk, amount in amounts.items() if amount}
+        if not amounts:
+            return
+        user_ids = list(user_ids)
+        items = cls.objects.filter(
+            user_id__in=user_ids, ingredient_id__in=amounts)
+        with transaction.atomic():
+            cls.objects.bulk_create(
+                (cls(user_id=user_id, ingredient_id=pk, amount=0)
+                 for user_id in user_ids
+                 for pk, amount in amounts.items() if amount > 0),
+                ignore_conflicts=True,
+            )
+            items.update(amount=Greatest(F('amount') + Case(
+                *(When(ingredient_id=pk, then=Value(amount))
+                  for pk, amount in amounts.items()),
+                default=Value(0),
+                output_field=IntegerField(),
+            ), Value(0)))
+            items.filter(amount=0).delete()
+
+    @classmethod
+    def update_recipe(cls, recipe, before):
+        """Изменение списков покупателей рецепта после замены его
+        продуктов, before - прежние количества из recipe_amounts."""
+        after = cls.recipe_amounts(recipe.pk)
+        cls.add_amounts(
+            recipe.purchases.values_list('user_id', flat=True),
+            {pk: after.get(pk, 0) - before.get(pk, 0)
+             for pk in before.keys() | after.keys()},
+        )
+
+    @classmethod
+    def rebuild(cls, user_ids=None):
+        """Пересчёт списков покупок пользователей по их корзинам
+        (для загрузки данных, в обход сигналов). Без user_ids
+        пересчитываются списки всех пользователей."""
+        items = cls.objects.all()
+        # Условие на покупателей задаётся одним filter(): второй вызов
+        # добавил бы ещё одно соединение с корзинами и умножил суммы
+        # на число покупателей рецепта.
+        if user_ids is None:
+            amounts = RecipeIngredient.objects.filter(
+                recipe__purchases__isnull=False)
+        else:
+            items = items.filter(user_id__in=user_ids)
+            amounts = RecipeIngredient.objects.filter(
+                recipe__purchases__user_id__in=user_ids)
+        with transaction.atomic():
+            items.delete()
+            cls.objects.bulk_create(
+                cls(user_id=row['recipe__purchases__user'],
+                    ingredient_id=row['ingredient'],
+                    amount=row['total'])
+                for row in amounts.values(
+                    'recipe__purchases__user', 'ingredient',
+                ).annotate(total=Sum('amount')).order_by()
+            )
+
+
 class Subscription(models.Model):
     user = models.ForeignKey(
         User,
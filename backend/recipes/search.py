@@ -0,0 +1,19 @@
+from importlib import import_module
+
+from django.db.migrations.recorder import MigrationRecorder
+
+# Объекты полнотекстового поиска описаны в миграции 0003_recipe_search
+search_migration = import_module('recipes.migrations.0003_recipe_search')
+
+
+def ensure_search_index(connection):
+    """Создание недостающих таблицы FTS5 и триггеров на SQLite.
+    Миграции Django о триггерах не знают, и пересоздание таблицы
+    recipes_recipe (например, AddField на SQLite) удаляет их.
+    Возвращает имена созданных объектов."""
+    if connection.vendor != 'sqlite' or (
+        ('recipes', '0003_recipe_search')
+        not in MigrationRecorder(connection).applied_migrations()
+    ):
+        return []
+    return search_migration.create_missing_search_objects(connection)
@@ -0,0 +1,50 @@
+from django.db import connections
+from django.db.models.signals import post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Purchase, Recipe, ShoppingListItem, User
+from .search import ensure_search_index
+from .variants import IMAGE_FIELDS, image_pipeline
+
+
+@receiver(post_save, sender=Purchase)
+def add_to_shopping_list(instance, created, raw=False, **kwargs):
+    """Добавление продуктов рецепта в список покупок пользователя.
+    После изменения продуктов рецепта списки покупателей обновляются
+    явно: в RecipeSerializer.create_update и RecipeAdmin.save_related."""
+    if created and not raw:
+        ShoppingListItem.add_amounts(
+            (instance.user_id,),
+            ShoppingListItem.recipe_amounts(instance.recipe_id))
+    else:
+        ShoppingListItem.rebuild((instance.user_id,))
+
+
+@receiver(pre_delete, sender=Purchase)
+def remove_from_shopping_list(instance, **kwargs):
+    """Вычитание продуктов рецепта из списка покупок. До удаления:
+    при удалении рецепта его продукты удаляются в той же операции."""
+    ShoppingListItem.add_amounts(
+        (instance.user_id,),
+        {pk: -amount for pk, amount in ShoppingListItem.recipe_amounts(
+            instance.recipe_id).items()})
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def process_image(sender, instance, raw=False, **kwargs):
+    """Создание уменьшенных копий нового изображения рецепта или аватара.
+    Для данных из фикстур копии создаются командой makevariants."""
+    if raw:
+        return
+    for model, field, variants in IMAGE_FIELDS:
+        if sender is model:
+            image_pipeline.schedule(instance, field, variants)
+
+
+@receiver(post_migrate)
+def restore_search_index(sender, using, **kwargs):
+    """Восстановление триггеров полнотекстового поиска SQLite,
+    удалённых миграциями, которые пересоздают таблицу рецептов."""
+    if sender.name == 'recipes':
+        ensure_search_index(connections[using])
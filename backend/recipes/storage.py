@@ -0,0 +1,29 @@
+from hashlib import sha256
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище медиафайлов с именами по хэшу содержимого: одинаковые
+    файлы сохраняются один раз, а файл под выданным именем больше
+    не меняется, что позволяет кэшировать его без срока давности."""
+
+    def __init__(self, **kwargs):
+        # Одновременная загрузка одного и того же файла перезаписывает
+        # его тем же содержимым.
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(**kwargs)
+
+    def _save(self, name, content):
+        digest = sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory, filename = posixpath.split(name)
+        name = posixpath.join(
+            directory, digest[:2],
+            digest + posixpath.splitext(filename)[1].lower())
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
@@ -0,0 +1,212 @@
+from io import StringIO
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from .constants import IMAGE_VARIANT_QUALITY
+from .models import (Favorite, Ingredient, Purchase, Recipe,
+                     RecipeIngredient, ShoppingListItem, Subscription, Tag,
+                     User)
+from .variants import expected_variants, variant_urls
+from .versions import get_version
+
+
+class ShoppingListTests(TestCase):
+    """Обновление списков покупок при изменении корзин и рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.first, cls.second = (
+            User.objects.create(username=name, email=f'{name}@test.ru')
+            for name in ('author', 'first', 'second')
+        )
+        cls.water = Ingredient.objects.create(
+            name='вода', measurement_unit='мл')
+        cls.salt = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        cls.soup, cls.tea = (
+            Recipe.objects.create(
+                name=name, text=name, cooking_time=10,
+                author=cls.author, image='recipes/images/test.jpg')
+            for name in ('Суп', 'Чай')
+        )
+        RecipeIngredient.objects.bulk_create((
+            RecipeIngredient(recipe=cls.soup, ingredient=cls.water,
+                             amount=2000),
+            RecipeIngredient(recipe=cls.soup, ingredient=cls.salt,
+                             amount=10),
+            RecipeIngredient(recipe=cls.tea, ingredient=cls.water,
+                             amount=300),
+        ))
+
+    def shopping_list(self, user):
+        return dict(ShoppingListItem.objects.filter(
+            user=user).values_list('ingredient__name', 'amount'))
+
+    def test_same_recipe_bought_by_two_users(self):
+        for user in (self.first, self.second):
+            Purchase.objects.create(user=user, recipe=self.soup)
+        Purchase.objects.create(user=self.second, recipe=self.tea)
+        self.assertEqual(self.shopping_list(self.first),
+                         {'вода': 2000, 'соль': 10})
+        self.assertEqual(self.shopping_list(self.second),
+                         {'вода': 2300, 'соль': 10})
+
+    def test_rebuild_all_and_selected_users(self):
+        for user in (self.first, self.second):
+            Purchase.objects.create(user=user, recipe=self.soup)
+        expected = {'вода': 2000, 'соль': 10}
+        for user_ids in (None, (self.second.id,),
+                         Purchase.objects.values('user_id')):
+            ShoppingListItem.rebuild(user_ids)
+            for user in (self.first, self.second):
+                self.assertEqual(self.shopping_list(user), expected)
+
+    def test_removed_purchase(self):
+        for user in (self.first, self.second):
+            Purchase.objects.create(user=user, recipe=self.soup)
+        Purchase.objects.filter(user=self.first).delete()
+        self.assertEqual(self.shopping_list(self.first), {})
+        self.assertEqual(self.shopping_list(self.second),
+                         {'вода': 2000, 'соль': 10})
+
+    def test_changed_recipe(self):
+        for user in (self.first, self.second):
+            Purchase.objects.create(user=user, recipe=self.soup)
+        Purchase.objects.create(user=self.second, recipe=self.tea)
+        pepper = Ingredient.objects.create(name='перец', measurement_unit='г')
+        before = ShoppingListItem.recipe_amounts(self.soup.id)
+        self.soup.recipeingredients.all().delete()
+        RecipeIngredient.objects.bulk_create((
+            RecipeIngredient(recipe=self.soup, ingredient=self.water,
+                             amount=1500),
+            RecipeIngredient(recipe=self.soup, ingredient=pepper, amount=5),
+        ))
+        ShoppingListItem.update_recipe(self.soup, before)
+        self.assertEqual(self.shopping_list(self.first),
+                         {'вода': 1500, 'перец': 5})
+        self.assertEqual(self.shopping_list(self.second),
+                         {'вода': 1800, 'перец': 5})
+        expected = {user: self.shopping_list(user)
+                    for user in (self.first, self.second)}
+        ShoppingListItem.rebuild()
+        for user, items in expected.items():
+            self.assertEqual(self.shopping_list(user), items)
+
+    def test_deleted_recipe(self):
+        Purchase.objects.create(user=self.first, recipe=self.soup)
+        Purchase.objects.create(user=self.first, recipe=self.tea)
+        self.soup.delete()
+        self.assertEqual(self.shopping_list(self.first), {'вода': 300})
+
+
+class AdminChangelistQueriesTests(TestCase):
+    """Количество запросов страниц списков админ-панели не зависит
+    от количества записей."""
+
+    # Количество запросов с учётом загрузки сессии и пользователя
+    QUERIES = {
+        'recipe': 12,
+        'foodgramuser': 5,
+        'tag': 5,
+        'ingredient': 6,
+        'subscription': 5,
+        'favorite': 5,
+        'purchase': 5,
+    }
+    SIZES = (3, 12)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@test.ru', password='admin')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        # Терцили времени приготовления кэшируются фильтром.
+        cache.clear()
+
+    def add_data(self, count):
+        """Дополнение БД до count пользователей, рецептов, тегов
+        и продуктов со связями между ними."""
+        start = User.objects.count()
+        for number in range(start, start + count):
+            user = User.objects.create(
+                username=f'user{number}', email=f'user{number}@test.ru',
+                first_name=f'Имя{number}', last_name=f'Фамилия{number}')
+            tag = Tag.objects.create(name=f'Тег{number}',
+                                     slug=f'tag{number}')
+            ingredient = Ingredient.objects.create(
+                name=f'Продукт{number}', measurement_unit='г')
+            recipe = Recipe.objects.create(
+                name=f'Рецепт{number}', text='Текст', cooking_time=number,
+                author=user, image='recipes/images/test.jpg')
+            recipe.tags.add(tag, *Tag.objects.all()[:2])
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=number)
+            for model in (Favorite, Purchase):
+                model.objects.bulk_create(
+                    model(user=user, recipe=other)
+                    for other in Recipe.objects.all()[:3])
+            Subscription.objects.bulk_create(
+                Subscription(user=user, author=author)
+                for author in User.objects.exclude(pk=user.pk)[:3])
+
+    def test_changelist_queries(self):
+        total = 0
+        for size in self.SIZES:
+            self.add_data(size - total)
+            total = size
+            for model, queries in self.QUERIES.items():
+                with self.subTest(model=model, size=size):
+                    with self.assertNumQueries(queries):
+                        response = self.client.get(
+                            f'/admin/recipes/{model}/')
+                    self.assertEqual(response.status_code, 200)
+
+
+class ReferenceImportTests(TestCase):
+    """Загрузка справочников сбрасывает версии справочников и рецептов:
+    в ответах о рецептах есть названия тегов и продуктов."""
+
+    def test_tag2db_invalidates_recipes(self):
+        Tag.objects.create(name='Завтрак', slug='breakfast')
+        versions = {prefix: get_version(prefix)
+                    for prefix in ('reference', 'recipes')}
+        with TemporaryDirectory() as directory:
+            path = Path(directory) / 'tags.json'
+            path.write_text(json.dumps(
+                [{'name': 'Утро', 'slug': 'breakfast'}]), encoding='U8')
+            call_command('tag2db', file=path, stdout=StringIO())
+        self.assertEqual(Tag.objects.get(slug='breakfast').name, 'Утро')
+        for prefix, version in versions.items():
+            with self.subTest(prefix=prefix):
+                self.assertNotEqual(get_version(prefix), version)
+
+
+class VariantNamesTests(SimpleTestCase):
+    """Имена копий изображений зависят от параметров копий."""
+
+    VARIANTS = {'thumb': (140, 140, True)}
+
+    def test_changed_params(self):
+        image = Recipe(image='recipes/images/test.jpg').image
+        stored = expected_variants(image, self.VARIANTS)
+        self.assertEqual(
+            variant_urls(image, stored, self.VARIANTS),
+            {'thumb': f'/media/{stored["thumb"]}'})
+        for variants in ({'thumb': (160, 160, True)},
+                         {'thumb': (140, 140, False)}):
+            with self.subTest(variants=variants):
+                self.assertEqual(variant_urls(image, stored, variants),
+                                 {'thumb': image.url})
+        with self.subTest(quality=IMAGE_VARIANT_QUALITY + 1), \
+                mock.patch('recipes.variants.IMAGE_VARIANT_QUALITY',
+                           IMAGE_VARIANT_QUALITY + 1):
+            self.assertEqual(variant_urls(image, stored, self.VARIANTS),
+                             {'thumb': image.url})
@@ -0,0 +1,116 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import logging
+from multiprocessing import get_context
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+
+from .constants import (AVATAR_VARIANTS, IMAGE_VARIANT_QUALITY,
+                        RECIPE_IMAGE_VARIANTS)
+from .images import make_variants, variant_name
+from .models import Recipe, User
+from .versions import invalidate
+
+logger = logging.getLogger(__name__)
+
+# Модель, поле изображения и копии, которые для него создаются
+IMAGE_FIELDS = (
+    (Recipe, 'image', RECIPE_IMAGE_VARIANTS),
+    (User, 'avatar', AVATAR_VARIANTS),
+)
+
+
+def expected_variants(image, variants):
+    """Имена копий, соответствующие текущему файлу изображения
+    и параметрам копий."""
+    if not image:
+        return {}
+    return {
+        variant: variant_name(image.name, variant, size,
+                              IMAGE_VARIANT_QUALITY)
+        for variant, size in variants.items()
+    }
+
+
+def variant_urls(image, stored, variants):
+    """Ссылки на копии изображения. Пока копия не создана или создана
+    с прежними параметрами, вместо неё отдаётся ссылка на оригинал."""
+    if not image:
+        return None
+    return {
+        variant: (default_storage.url(name) if stored.get(variant) == name
+                  else image.url)
+        for variant, name in expected_variants(image, variants).items()
+    }
+
+
+class ImagePipeline:
+    """Создание уменьшенных копий изображений в пуле процессов.
+    Оригинал сохраняется запросом, имена готовых копий записываются
+    в поле <поле изображения>_variants после завершения обработки."""
+
+    def __init__(self):
+        self.executor = None
+        self.lock = Lock()
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=settings.IMAGE_WORKERS,
+                    mp_context=get_context('spawn'),
+                )
+            return self.executor
+
+    def schedule(self, instance, field, variants):
+        """Запуск обработки после фиксации транзакции, если копии
+        не соответствуют текущему изображению."""
+        image = getattr(instance, field)
+        if getattr(instance, f'{field}_variants') == expected_variants(
+                image, variants):
+            return
+        model, pk, name = type(instance), instance.pk, image.name
+        transaction.on_commit(
+            lambda: self.submit(model, pk, field, name, variants),
+            robust=True,
+        )
+
+    def submit(self, model, pk, field, name, variants):
+        if not name:
+            return self.save(model, pk, field, name, {})
+        args = (settings.MEDIA_ROOT, name, variants, IMAGE_VARIANT_QUALITY)
+        if not settings.IMAGE_WORKERS:
+            return self.save(model, pk, field, name, make_variants(*args))
+        self.get_executor().submit(make_variants, *args).add_done_callback(
+            lambda future: self.done(future, model, pk, field, name))
+
+    def done(self, future, model, pk, field, name):
+        try:
+            result = future.result()
+        except Exception as error:
+            logger.exception('Не удалось обработать изображение %s', name)
+            if isinstance(error, BrokenProcessPool):
+                with self.lock:
+                    self.executor = None
+            return
+        try:
+            self.save(model, pk, field, name, result)
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    def save(model, pk, field, name, result):
+        # Условие по имени файла не даёт записать копии изображения,
+        # заменённого за время обработки.
+        image = (Q(**{field: name}) if name
+                 else Q(**{field: ''}) | Q(**{f'{field}__isnull': True}))
+        model.objects.filter(image, pk=pk).update(
+            **{f'{field}_variants': result})
+        invalidate('recipes')
+
+
+image_pipeline = ImagePipeline()
@@ -0,0 +1,34 @@
+from time import time_ns
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def get_cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def is_process_local_cache():
+    """Кэш в памяти процесса: версии, сброшенные командами manage.py
+    и другими воркерами, запущенному серверу не видны."""
+    return isinstance(get_cache(), LocMemCache)
+
+
+def get_version(prefix):
+    """Текущая версия данных раздела (время изменения в наносекундах),
+    сбрасывается сигналами моделей и командами загрузки данных.
+    Хранится без срока жизни: истечение версии сбрасывало бы
+    ETag и снимки без изменения данных."""
+    return get_cache().get_or_set(f'api:{prefix}:version', time_ns, None)
+
+
+def invalidate(prefix):
+    get_cache().delete(f'api:{prefix}:version')
+
+
+def invalidate_reference():
+    """Сброс версий справочников и рецептов: ответы о рецептах
+    содержат названия тегов и продуктов."""
+    invalidate('reference')
+    invalidate('recipes')
@@ -82,6 +82,7 @@ const SingleCard = ({ loadItem, updateOrders }) => {
   const {
     author = {},
     image,
+    images,
     tags,
     cooking_time,
     name,
@@ -101,7 +102,7 @@ const SingleCard = ({ loadItem, updateOrders }) => {
         </MetaTags>
         <div className={styles["single-card"]}>
           <img
-            src={image}
+            src={images?.detail || image}
             alt={name}
             className={styles["single-card__image"]}
           />
@@ -156,7 +157,7 @@ const SingleCard = ({ loadItem, updateOrders }) => {
                     className={styles["single-card__user-avatar"]}
                     style={{
                       "background-image": `url(${
-                        author.avatar || DefaultImage
+                        author.avatars?.small || author.avatar || DefaultImage
                       })`,
                     }}
                   />